@@ -1,7 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
     verbose_name = 'API'
+
+    def ready(self):
+        from .metrics import install_execute_wrapper
+
+        connection_created.connect(
+            install_execute_wrapper,
+            dispatch_uid='api.install_execute_wrapper'
+        )
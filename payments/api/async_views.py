@@ -0,0 +1,204 @@
+"""Асинхронные (ASGI) варианты представлений для оплаты.
+
+Запросы к Stripe идут через *_async методы клиента, БД — через
+асинхронный ORM, поэтому один ASGI-воркер держит много оплат
+одновременно, не блокируясь на время ответа Stripe.
+"""
+import stripe
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+
+from core.cache import aget_cached
+from core.models import Item, Order
+from .mixins import (
+    CheckoutParamsMixin,
+    StripeErrorHandlerMixin,
+    StripeIdempotencyMixin,
+    StripeKeysMixin,
+)
+from .throttling import async_single_flight
+
+
+# Как и APIView синхронных вариантов: API без сессионной
+# аутентификации, CSRF-токен не требуется.
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncStripeView(
+    StripeKeysMixin,
+    StripeErrorHandlerMixin,
+    StripeIdempotencyMixin,
+    CheckoutParamsMixin,
+    View
+):
+    """Базовое асинхронное представление для работы со Stripe."""
+
+    error_response_class = JsonResponse
+
+    async def acoalesce(self, key, coroutine_function):
+        """Одинаковые одновременные вызовы в event loop делят один
+        запрос к Stripe (api/throttling.py); только для заказа."""
+        if not settings.STRIPE_COALESCE_REQUESTS:
+            return await coroutine_function()
+        return await async_single_flight.do(key, coroutine_function)
+
+    async def aget_item(self, item_id):
+        try:
+            return await aget_cached(Item, item_id)
+        except Item.DoesNotExist:
+            raise Http404('No Item matches the given query.')
+
+    async def aget_order(self, order_id):
+        try:
+            return await Order.objects.with_related().with_totals().aget(
+                id=order_id)
+        except Order.DoesNotExist:
+            raise Http404('No Order matches the given query.')
+
+    async def aremember_checkout_session(
+        self, order, content_hash, session_id
+    ):
+        await Order.objects.filter(pk=order.pk).aupdate(
+            **self.get_checkout_session_fields(
+                order, content_hash, session_id))
+
+    async def aremember_payment_intent(self, order, content_hash, intent):
+        await Order.objects.filter(pk=order.pk).aupdate(
+            **self.get_payment_intent_fields(
+                order, content_hash, intent.id))
+
+    async def aget_reusable_checkout_session(
+        self, client, order, content_hash
+    ):
+        session_id = self.get_reusable_checkout_session_id(
+            order, content_hash)
+        if session_id:
+            checkout_session = (
+                await client.v1.checkout.sessions.retrieve_async(session_id))
+            if self.is_checkout_session_reusable(checkout_session):
+                return checkout_session
+        return None
+
+    async def aget_reusable_payment_intent(self, client, order, content_hash):
+        payment_intent_id = self.get_reusable_payment_intent_id(
+            order, content_hash)
+        if payment_intent_id:
+            intent = await client.v1.payment_intents.retrieve_async(
+                payment_intent_id)
+            if self.is_payment_intent_reusable(intent):
+                return intent
+        return None
+
+
+class AsyncCreateCheckoutSessionView(AsyncStripeView):
+    """Создание Stripe Checkout Session для одного товара."""
+
+    async def get(self, request, id):
+        item = await self.aget_item(id)
+        if not item.currency:
+            return JsonResponse(
+                {'error': 'Валюта товара не определена'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            client = self.get_async_stripe_client(item.currency)
+            checkout_session = (
+                await client.v1.checkout.sessions.create_async(
+                    self.get_item_checkout_params(item))
+            )
+            return JsonResponse({'id': checkout_session.id})
+        except stripe.error.StripeError as e:
+            return self.handle_stripe_error(e)
+        except Exception as e:
+            return self.handle_generic_error(e)
+
+
+class AsyncCreatePaymentIntentView(AsyncStripeView):
+    """Создает Stripe Payment Intent для одного товара."""
+
+    async def get(self, request, id):
+        item = await self.aget_item(id)
+        stripe_keys = self.get_stripe_keys(item.currency)
+        client = self.get_async_stripe_client(item.currency)
+        try:
+            intent = await client.v1.payment_intents.create_async(
+                self.get_item_payment_intent_params(item))
+            return JsonResponse({
+                'clientSecret': intent.client_secret,
+                'publishableKey': stripe_keys['publishable_key']
+            })
+        except stripe.error.StripeError as e:
+            return self.handle_stripe_error(e)
+        except Exception as e:
+            return self.handle_generic_error(e)
+
+
+class AsyncOrderCheckoutSessionView(AsyncStripeView):
+    """Создает Checkout Session для Order с несколькими товарами."""
+
+    async def get(self, request, order_id):
+        order = await self.aget_order(order_id)
+        content_hash = order.get_content_hash()
+        client = self.get_async_stripe_client(order.get_currency())
+
+        async def create():
+            checkout_session = await self.aget_reusable_checkout_session(
+                client, order, content_hash)
+            if checkout_session is None:
+                checkout_session = (
+                    await client.v1.checkout.sessions.create_async(
+                        self.get_order_checkout_params(order),
+                        self.get_idempotency_options(
+                            'checkout', order, content_hash,
+                            order.checkout_session_id)
+                    )
+                )
+                await self.aremember_checkout_session(
+                    order, content_hash, checkout_session.id)
+            return {'id': checkout_session.id}
+
+        try:
+            return JsonResponse(await self.acoalesce(
+                f'order-checkout:{order.pk}:{content_hash}', create))
+        except stripe.error.StripeError as e:
+            return self.handle_stripe_error(e)
+        except Exception as e:
+            return self.handle_generic_error(e)
+
+
+class AsyncOrderPaymentIntentView(AsyncStripeView):
+    """Создает Payment Intent для Order."""
+
+    async def post(self, request, order_id):
+        order = await self.aget_order(order_id)
+        currency = order.get_currency()
+        stripe_keys = self.get_stripe_keys(currency)
+        client = self.get_async_stripe_client(currency)
+        content_hash = order.get_content_hash()
+
+        async def create():
+            intent = await self.aget_reusable_payment_intent(
+                client, order, content_hash)
+            if intent is None:
+                intent = await client.v1.payment_intents.create_async(
+                    self.get_order_payment_intent_params(order, currency),
+                    self.get_idempotency_options(
+                        'payment-intent', order, content_hash,
+                        order.payment_intent_id)
+                )
+                await self.aremember_payment_intent(
+                    order, content_hash, intent)
+            return {
+                'clientSecret': intent.client_secret,
+                'publishableKey': stripe_keys['publishable_key']
+            }
+
+        try:
+            return JsonResponse(await self.acoalesce(
+                f'order-payment-intent:{order.pk}:{content_hash}', create))
+        except stripe.error.StripeError as e:
+            return self.handle_stripe_error(e)
+        except Exception as e:
+            return self.handle_generic_error(e)
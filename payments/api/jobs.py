@@ -0,0 +1,228 @@
+"""Фоновые задачи Stripe с очередью в БД.
+
+Представления кладут задачу в таблицу StripeJob и сразу отвечают 202.
+Задачи выполняет StripeJobWorker — пул из STRIPE_JOBS_CONCURRENCY
+потоков: либо в процессе приложения (STRIPE_JOBS_IN_PROCESS), либо в
+отдельном процессе командой process_stripe_jobs. Внешний брокер не
+нужен: очередь — обычная таблица в той же БД.
+
+Задача берется в работу условным UPDATE, поэтому несколько воркеров не
+выполнят ее дважды. Пока задача выполняется, run_after служит арендой:
+задачу упавшего воркера по ее истечении возьмет другой.
+"""
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.models import Item, Order, StripeJob, StripeJobKind, StripeJobStatus
+from .mixins import StripeOperationsMixin
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (
+    stripe.error.RateLimitError,
+    stripe.error.APIConnectionError,
+)
+
+
+class StripeJobRunner(StripeOperationsMixin):
+    """Выполняет задачу теми же методами, что и представления."""
+
+    def run(self, job):
+        if job.kind == StripeJobKind.ITEM_CHECKOUT:
+            return self.create_item_checkout_session(
+                Item.objects.get(pk=job.object_id),
+                self.get_job_idempotency_options(job)
+            )
+        if job.kind == StripeJobKind.ITEM_PAYMENT_INTENT:
+            return self.create_item_payment_intent(
+                Item.objects.get(pk=job.object_id),
+                self.get_job_idempotency_options(job)
+            )
+        order = Order.objects.with_related().with_totals().get(
+            pk=job.object_id)
+        if job.kind == StripeJobKind.ORDER_CHECKOUT:
+            return self.create_order_checkout_session(order)
+        return self.create_order_payment_intent(order)
+
+    def get_job_idempotency_options(self, job):
+        # Повтор задачи после сбоя сети не создаст второй объект.
+        return {'idempotency_key': f'job-{job.pk}'}
+
+
+def enqueue_stripe_job(kind, object_id):
+    """Ставит задачу в очередь и будит воркер в процессе, если он есть."""
+    job = StripeJob.objects.create(kind=kind, object_id=str(object_id))
+    if settings.STRIPE_JOBS_IN_PROCESS:
+        worker = get_in_process_worker()
+        transaction.on_commit(worker.wake)
+    return job
+
+
+def get_retry_delay(attempts):
+    """Экспоненциальная задержка перед повтором с разбросом."""
+    delay = min(
+        settings.STRIPE_JOBS_RETRY_MAX_DELAY,
+        settings.STRIPE_JOBS_RETRY_BASE_DELAY * 2 ** (attempts - 1)
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def claim_stripe_jobs(limit):
+    """Берет в работу до limit задач, срок запуска которых наступил."""
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=settings.STRIPE_JOBS_LEASE_SECONDS)
+    candidates = (
+        StripeJob.objects
+        .filter(
+            status__in=[StripeJobStatus.QUEUED, StripeJobStatus.RUNNING],
+            run_after__lte=now
+        )
+        .order_by('run_after')
+        .values_list('pk', 'attempts')[:limit]
+    )
+    claimed = []
+    for pk, attempts in candidates:
+        # Условие на attempts: задачу уже мог взять другой воркер.
+        if StripeJob.objects.filter(pk=pk, attempts=attempts).update(
+            status=StripeJobStatus.RUNNING,
+            attempts=attempts + 1,
+            run_after=lease_until
+        ):
+            claimed.append(pk)
+    return list(StripeJob.objects.filter(pk__in=claimed))
+
+
+def finish_stripe_job(job, status, result=None, error=''):
+    StripeJob.objects.filter(pk=job.pk).update(
+        status=status, result=result, error=error,
+        finished_at=timezone.now()
+    )
+
+
+def run_stripe_job(job, runner=None):
+    """Выполняет задачу и сохраняет результат, ошибку или повтор."""
+    runner = runner or StripeJobRunner()
+    try:
+        result = runner.run(job)
+    except RETRYABLE_ERRORS as error:
+        if job.attempts >= settings.STRIPE_JOBS_MAX_ATTEMPTS:
+            finish_stripe_job(job, StripeJobStatus.FAILED, error=str(error))
+            return
+        StripeJob.objects.filter(pk=job.pk).update(
+            status=StripeJobStatus.QUEUED,
+            error=str(error),
+            run_after=timezone.now() + timedelta(seconds=max(
+                get_retry_delay(job.attempts),
+                # Сколько ждать, знает ограничитель частоты.
+                getattr(error, 'retry_after', 0)
+            ))
+        )
+    except stripe.error.StripeError as error:
+        finish_stripe_job(
+            job, StripeJobStatus.FAILED,
+            error=str(getattr(error, 'user_message', None) or error)
+        )
+    except (Item.DoesNotExist, Order.DoesNotExist):
+        finish_stripe_job(
+            job, StripeJobStatus.FAILED, error='Объект не найден')
+    except Exception as error:
+        logger.exception('Задача Stripe %s завершилась ошибкой', job.pk)
+        finish_stripe_job(job, StripeJobStatus.FAILED, error=str(error))
+    else:
+        finish_stripe_job(job, StripeJobStatus.SUCCEEDED, result=result)
+
+
+class StripeJobWorker:
+    """Пул потоков, выполняющий задачи из очереди.
+
+    Одновременно выполняется не больше concurrency задач: новые
+    задачи берутся из БД, только когда в пуле есть свободные потоки.
+    """
+
+    def __init__(self, concurrency=None, poll_interval=None):
+        self.concurrency = concurrency or settings.STRIPE_JOBS_CONCURRENCY
+        self.poll_interval = (
+            poll_interval or settings.STRIPE_JOBS_POLL_INTERVAL)
+        self.executor = ThreadPoolExecutor(
+            self.concurrency, thread_name_prefix='stripe-job')
+        self.runner = StripeJobRunner()
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run_job(self, job):
+        try:
+            run_stripe_job(job, self.runner)
+        finally:
+            close_old_connections()
+            with self.lock:
+                self.in_flight -= 1
+            self.wake()
+
+    def run_once(self):
+        """Запускает столько задач, сколько есть свободных потоков."""
+        with self.lock:
+            free = self.concurrency - self.in_flight
+        if free <= 0:
+            return 0
+        jobs = claim_stripe_jobs(free)
+        with self.lock:
+            self.in_flight += len(jobs)
+        for job in jobs:
+            self.executor.submit(self.run_job, job)
+        return len(jobs)
+
+    def run_forever(self):
+        while True:
+            try:
+                started = self.run_once()
+            except Exception:
+                logger.exception('Не удалось получить задачи Stripe')
+                started = 0
+            finally:
+                close_old_connections()
+            if not started:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def drain(self):
+        """Выполняет все готовые задачи и ждет их завершения."""
+        total = 0
+        while True:
+            started = self.run_once()
+            total += started
+            if not started:
+                with self.lock:
+                    if not self.in_flight:
+                        return total
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+
+_in_process_worker = None
+_in_process_lock = threading.Lock()
+
+
+def get_in_process_worker():
+    """Воркер в фоновом потоке процесса приложения (создается один раз)."""
+    global _in_process_worker
+    with _in_process_lock:
+        if _in_process_worker is None:
+            _in_process_worker = StripeJobWorker()
+            threading.Thread(
+                target=_in_process_worker.run_forever,
+                name='stripe-job-worker',
+                daemon=True
+            ).start()
+    return _in_process_worker
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import StripeJobWorker
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задачи Stripe из очереди в БД.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=None,
+            help='Сколько задач выполнять одновременно.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Пауза в секундах, когда готовых задач нет.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        worker = StripeJobWorker(options['concurrency'], options['interval'])
+        if options['once']:
+            processed = worker.drain()
+            self.stdout.write(f'Выполнено задач: {processed}')
+            return
+        worker.run_forever()
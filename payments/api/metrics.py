@@ -0,0 +1,199 @@
+"""Метрики производительности запросов.
+
+RequestMetricsMiddleware заводит на каждый запрос RequestMetrics и
+кладет его в contextvar. Измерения добавляются в него:
+
+* запросы к БД — обертка db_execute_wrapper, которую получает каждое
+  новое соединение (сигнал connection_created);
+* вызовы Stripe — HTTP-клиентами из api/stripe_clients.py;
+* сериализация и рендеринг — блоками `with measure('serialize'):`.
+
+По окончании запроса итоги попадают в гистограммы процесса, которые
+отдает в формате Prometheus MetricsView (/metrics).
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Время и число операций по видам в рамках одного запроса."""
+
+    max_queries = 200
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.counts = {}
+        self.queries = []
+        self.active = set()
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def add_query(self, sql, seconds):
+        self.add('db', seconds)
+        if len(self.queries) < self.max_queries:
+            self.queries.append((seconds, sql))
+
+    def get_slowest_queries(self, limit=10):
+        return sorted(self.queries, key=lambda query: -query[0])[:limit]
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+
+def start_request_metrics():
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def finish_request_metrics(token):
+    _current.reset(token)
+
+
+@contextmanager
+def measure(name):
+    """Засекает время блока. Вложенные блоки с тем же именем не
+    считаются повторно (например, вложенный сериализатор)."""
+    metrics = _current.get()
+    if metrics is None or name in metrics.active:
+        yield
+        return
+    metrics.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.active.discard(name)
+        metrics.add(name, time.perf_counter() - started)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Ставит db_execute_wrapper на соединение один раз.
+
+    Соединения БД у каждого потока свои: под ASGI синхронный код
+    запроса выполняется в другом потоке, чем middleware, поэтому
+    обертка стоит на всех соединениях, а вне запроса ничего не делает.
+    """
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами, как в Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Гистограммы процесса по имени метрики и представлению."""
+
+    metrics = {
+        'request_duration_seconds': ('Время запроса', SECONDS_BUCKETS),
+        'db_queries': ('Запросов к БД за запрос', COUNT_BUCKETS),
+        'db_duration_seconds': ('Время БД за запрос', SECONDS_BUCKETS),
+        'stripe_calls': ('Вызовов Stripe за запрос', COUNT_BUCKETS),
+        'stripe_duration_seconds': (
+            'Время Stripe за запрос', SECONDS_BUCKETS),
+        'serialize_duration_seconds': (
+            'Время сериализации за запрос', SECONDS_BUCKETS),
+        'render_duration_seconds': (
+            'Время рендеринга шаблонов за запрос', SECONDS_BUCKETS),
+    }
+    prefix = 'payments_'
+
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, view, value):
+        with self.lock:
+            histogram = self.histograms.get((name, view))
+            if histogram is None:
+                histogram = self.histograms[(name, view)] = Histogram(
+                    self.metrics[name][1])
+            histogram.observe(value)
+
+    def observe_request(self, view, metrics):
+        self.observe('request_duration_seconds', view, metrics.duration)
+        self.observe('db_queries', view, metrics.counts.get('db', 0))
+        self.observe(
+            'db_duration_seconds', view, metrics.timings.get('db', 0.0))
+        self.observe('stripe_calls', view, metrics.counts.get('stripe', 0))
+        self.observe(
+            'stripe_duration_seconds', view,
+            metrics.timings.get('stripe', 0.0)
+        )
+        self.observe(
+            'serialize_duration_seconds', view,
+            metrics.timings.get('serialize', 0.0)
+        )
+        self.observe(
+            'render_duration_seconds', view,
+            metrics.timings.get('render', 0.0)
+        )
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus."""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            snapshot = [
+                (name, view, list(h.counts), h.sum, h.count, h.buckets)
+                for (name, view), h in histograms
+            ]
+        lines = []
+        described = set()
+        for name, view, counts, total, count, buckets in snapshot:
+            full_name = self.prefix + name
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {full_name} {self.metrics[name][0]}')
+                lines.append(f'# TYPE {full_name} histogram')
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{full_name}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(f'{full_name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{full_name}_count{{view="{view}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+
+registry = MetricsRegistry()
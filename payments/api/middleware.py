@@ -0,0 +1,106 @@
+import logging
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import (
+    finish_request_metrics,
+    registry,
+    start_request_metrics,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """Замеряет запрос: БД, вызовы Stripe, сериализацию и рендеринг.
+
+    Итоги отдаются клиенту в заголовке Server-Timing (их показывает
+    вкладка Network в браузере) и копятся в гистограммах для /metrics.
+    Запросы дольше SLOW_REQUEST_MS пишутся в лог вместе с самыми
+    медленными SQL-запросами.
+    """
+
+    # Заголовки HTTP допускают только ASCII, поэтому описания
+    # по-английски.
+    timings = (
+        ('db', 'queries'),
+        ('stripe', 'Stripe calls'),
+        ('stripe_wait', 'rate limit tokens'),
+        ('serialize', 'serializations'),
+        ('render', 'templates'),
+    )
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Синхронный middleware под ASGI выполнял бы все запросы в одном
+        # потоке, поэтому для асинхронной цепочки он тоже асинхронный.
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = start_request_metrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request_metrics(token)
+        return self.process_metrics(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = start_request_metrics()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request_metrics(token)
+        return self.process_metrics(request, response, metrics)
+
+    def process_metrics(self, request, response, metrics):
+        view = self.get_view_name(request)
+        registry.observe_request(view, metrics)
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = self.build_server_timing(metrics)
+        duration_ms = metrics.duration * 1000
+        if (
+            duration_ms >= settings.SLOW_REQUEST_MS
+            and random.random() < settings.SLOW_REQUEST_SAMPLE_RATE
+        ):
+            self.log_slow_request(request, view, metrics, duration_ms)
+        return response
+
+    def get_view_name(self, request):
+        match = getattr(request, 'resolver_match', None)
+        return match.view_name if match else 'unmatched'
+
+    def build_server_timing(self, metrics):
+        entries = []
+        for name, description in self.timings:
+            if name in metrics.counts:
+                entries.append(
+                    f'{name};dur={metrics.timings[name] * 1000:.1f};'
+                    f'desc="{metrics.counts[name]} {description}"'
+                )
+        entries.append(f'total;dur={metrics.duration * 1000:.1f}')
+        return ', '.join(entries)
+
+    def log_slow_request(self, request, view, metrics, duration_ms):
+        queries = '\n'.join(
+            f'  {seconds * 1000:8.1f} мс  {sql}'
+            for seconds, sql in metrics.get_slowest_queries(
+                settings.SLOW_REQUEST_LOG_QUERIES)
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.0f мс, БД %d запросов '
+            '%.0f мс, Stripe %d вызовов %.0f мс\n%s',
+            request.method, request.get_full_path(), view, duration_ms,
+            metrics.counts.get('db', 0),
+            metrics.timings.get('db', 0.0) * 1000,
+            metrics.counts.get('stripe', 0),
+            metrics.timings.get('stripe', 0.0) * 1000,
+            queries
+        )
@@ -1,59 +1,86 @@
-import stripe
+import csv
+import hashlib
+import json
+import math
+
+from datetime import timedelta
 
+import stripe
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.response import Response
 
 from django.conf import settings
+from core.cache import get_cached
+from core.cart import CartError
 from core.models import Item, Order
+from core.pricing import from_cents, get_payment_intent_amount, to_cents
+from core.stripe_accounts import get_registry
+from .stripe_clients import get_async_stripe_client, get_stripe_client
+from .throttling import single_flight
 
 
 class StripeKeysMixin:
     """Миксин для работы со Stripe-ключами"""
 
     def get_stripe_keys(self, currency):
-        """Получает Stripe-ключи в зависимости от валюты"""
-        if currency == 'eur':
-            publishable_key = settings.STRIPE_PUBLISHABLE_KEY_EUR
-            secret_key = settings.STRIPE_SECRET_KEY_EUR
-        else:
-            publishable_key = settings.STRIPE_PUBLISHABLE_KEY
-            secret_key = settings.STRIPE_SECRET_KEY
-
-        if not secret_key or not publishable_key:
-            raise ValueError(
-                f'Stripe-ключи не настроены для валюты: {currency}')
-
+        """Получает Stripe-ключи аккаунта, принимающего валюту."""
+        account = get_registry().get_for_currency(currency)
         return {
-            'publishable_key': publishable_key,
-            'secret_key': secret_key
+            'publishable_key': account.publishable_key,
+            'secret_key': account.secret_key
         }
 
-    def set_stripe_api_key(self, currency):
-        """Устаналивает Stripe-ключ."""
-        stripe_keys = self.get_stripe_keys(currency)
-        stripe.api_key = stripe_keys['secret_key']
-        return stripe_keys
+    def get_stripe_client(self, currency):
+        """Возвращает Stripe-клиент аккаунта для валюты."""
+        return get_stripe_client(self.get_stripe_keys(currency)['secret_key'])
+
+    def get_async_stripe_client(self, currency):
+        """Возвращает Stripe-клиент для асинхронных представлений."""
+        return get_async_stripe_client(
+            self.get_stripe_keys(currency)['secret_key'])
 
 
 class StripeErrorHandlerMixin:
     """Миксин для обработки ошибок Stripe."""
 
+    # Асинхронные представления подменяют его на JsonResponse.
+    error_response_class = Response
+
     def handle_stripe_error(self, stripe_error):
         """Обработка ошибок Stripe."""
+        if isinstance(stripe_error, stripe.error.RateLimitError):
+            return self.handle_rate_limit_error(stripe_error)
         error_message = (
             str(stripe_error.user_message)
             if hasattr(stripe_error, 'user_message')
             else str(stripe_error)
         )
-        return Response(
+        return self.error_response_class(
             {'error': error_message},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    def handle_rate_limit_error(self, stripe_error):
+        """Лимит запросов к Stripe: ошибка не клиента, а временная."""
+        response = self.error_response_class(
+            {'error': 'Платежная система перегружена, повторите позже'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        response['Retry-After'] = str(
+            math.ceil(getattr(stripe_error, 'retry_after', 1)))
+        return response
+
     def handle_generic_error(self, exception):
         """Обработка общих ошибок."""
-        return Response(
+        return self.error_response_class(
             {'error': 'Internal server error'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
@@ -63,46 +90,38 @@ class ItemRetrievalMixin:
     """Миксин для получения товаров."""
 
     def get_item(self, item_id):
-        return get_object_or_404(Item, id=item_id)
+        try:
+            return get_cached(Item, item_id)
+        except Item.DoesNotExist:
+            raise Http404('No Item matches the given query.')
 
 
 class OrderRetrievalMixin:
     """Миксин для получения заказов."""
 
     def get_order(self, order_id):
-        return get_object_or_404(Order, id=order_id)
+        return get_object_or_404(
+            Order.objects.with_related().with_totals(), id=order_id)
 
 
 class LineItemsMixin:
+    """Миксин для сборки позиций Stripe Checkout.
+
+    price_data товаров заранее посчитан и хранится в Item, здесь
+    остается только добавить количество.
+    """
 
     def create_item_line_item(self, item):
-        return {
-            'price_data': {
-                'currency': item.currency,
-                'product_data': {
-                    'name': item.name,
-                    'description': item.description,
-                },
-                'unit_amount': int(item.price * 100),
-            },
-            'quantity': 1,
-        }
+        return {'price_data': item.get_price_data(), 'quantity': 1}
 
     def create_order_line_items(self, order):
-        line_items = []
-        for order_item in order.order_items.all():
-            line_items.append({
-                'price_data': {
-                    'currency': order.get_currency(),
-                    'product_data': {
-                        'name': order_item.item.name,
-                        'description': order_item.item.description,
-                    },
-                    'unit_amount': int(order_item.item.price * 100),
-                },
+        return [
+            {
+                'price_data': order_item.item.get_price_data(),
                 'quantity': order_item.quantity,
-            })
-        return line_items
+            }
+            for order_item in order.order_items.all()
+        ]
 
 
 class DiscountTaxMixin:
@@ -126,3 +145,451 @@ class DiscountTaxMixin:
     def get_tax_rates(self, order):
         """Получает налоговую ставку."""
         return [order.tax.tax_id] if order.tax and order.tax.tax_id else []
+
+
+class CheckoutParamsMixin(LineItemsMixin, DiscountTaxMixin):
+    """Миксин для сборки параметров запросов к Stripe.
+
+    Общий для синхронных и асинхронных представлений.
+    """
+
+    def get_item_checkout_params(self, item):
+        """Параметры Checkout Session для одного товара."""
+        return {
+            'payment_method_types': ['card'],
+            'line_items': [self.create_item_line_item(item)],
+            'mode': 'payment',
+            'success_url': f'{settings.DOMAIN}/success/',
+            'cancel_url': f'{settings.DOMAIN}/cancel/',
+        }
+
+    def get_item_payment_intent_params(self, item):
+        """Параметры Payment Intent для одного товара."""
+        return {
+            'amount': to_cents(item.price),
+            'currency': item.currency,
+            'metadata': {'item_id': item.id},
+            'automatic_payment_methods': {'enabled': True},
+        }
+
+    def get_order_checkout_params(self, order):
+        """Параметры Checkout Session для заказа."""
+        checkout_params = {
+            'payment_method_types': ['card'],
+            'line_items': self.create_order_line_items(order),
+            'mode': 'payment',
+            'success_url': f'{settings.DOMAIN}/success/',
+            'cancel_url': f'{settings.DOMAIN}/cancel/',
+            'metadata': {'order_id': str(order.id)},
+        }
+        # Добавляем скидку если есть.
+        discounts = self.get_discount_params(order)
+        if discounts:
+            checkout_params['discounts'] = discounts
+        # Добавляем параметры налогов.
+        checkout_params.update(self.get_tax_params(order))
+        tax_rates = self.get_tax_rates(order)
+        if tax_rates:
+            checkout_params['tax_rates'] = tax_rates
+        return checkout_params
+
+    def get_order_payment_intent_params(self, order, currency):
+        """Параметры Payment Intent для заказа."""
+        # Суммы в центах уже посчитаны в with_totals().
+        totals = order.get_totals()
+        intent_params = {
+            'amount': get_payment_intent_amount(totals, bool(order.tax)),
+            'currency': currency,
+            'metadata': {'order_id': str(order.id)},
+            'automatic_payment_methods': {'enabled': True},
+        }
+        if order.tax:
+            intent_params['description'] = (
+                f'{order.tax.rate}% {order.tax.name}')
+        # Если есть скидка
+        if order.discount and order.discount.coupon_id:
+            intent_params['discounts'] = [{
+                'coupon': order.discount.coupon_id
+            }]
+        return intent_params
+
+
+class StripeIdempotencyMixin:
+    """Миксин для повторного использования объектов Stripe заказа.
+
+    Пока содержимое заказа не изменилось, повторные запросы получают
+    уже созданные Checkout Session и Payment Intent: вместо создания
+    нового объекта Stripe одно чтение проверяет, что сохраненный еще
+    можно оплатить (сессия открыта, платеж не завершен и не отменен).
+    Новые объекты создаются с ключом идемпотентности, поэтому
+    одновременные запросы тоже не плодят дубликаты.
+    """
+
+    # Статусы, в которых объект Stripe еще принимает оплату.
+    REUSABLE_CHECKOUT_STATUSES = frozenset({'open'})
+    FINAL_PAYMENT_INTENT_STATUSES = frozenset({'succeeded', 'canceled'})
+
+    def get_idempotency_options(self, kind, order, content_hash, replaces):
+        """Ключ идемпотентности нового объекта Stripe.
+
+        replaces — id объекта, который новый заменяет (истекшая сессия,
+        отмененный платеж): с прежним ключом Stripe вернул бы его же.
+        """
+        key = f'order-{order.id}-{kind}-{content_hash}'
+        if replaces:
+            key = f'{key}-{replaces}'
+        return {'idempotency_key': key}
+
+    def is_reusable(self, stripe_id, stored_hash, created_at, content_hash):
+        """Можно ли отдать ранее созданный объект Stripe.
+
+        Проверяет только поля заказа; статус объекта в Stripe
+        проверяют is_checkout_session_reusable() и
+        is_payment_intent_reusable().
+        """
+        return bool(
+            stripe_id
+            and stored_hash == content_hash
+            and created_at
+            and timezone.now() - created_at < timedelta(
+                seconds=settings.STRIPE_OBJECT_REUSE_SECONDS)
+        )
+
+    def get_reusable_checkout_session_id(self, order, content_hash):
+        if self.is_reusable(
+            order.checkout_session_id,
+            order.checkout_hash,
+            order.checkout_created_at,
+            content_hash
+        ):
+            return order.checkout_session_id
+        return None
+
+    def get_reusable_payment_intent_id(self, order, content_hash):
+        if self.is_reusable(
+            order.payment_intent_id,
+            order.payment_intent_hash,
+            order.payment_intent_created_at,
+            content_hash
+        ):
+            return order.payment_intent_id
+        return None
+
+    def is_checkout_session_reusable(self, checkout_session):
+        return checkout_session.status in self.REUSABLE_CHECKOUT_STATUSES
+
+    def is_payment_intent_reusable(self, intent):
+        return intent.status not in self.FINAL_PAYMENT_INTENT_STATUSES
+
+    def get_totals_fields(self, order):
+        """Суммы, с которыми создан объект Stripe.
+
+        Сохраняются в заказ вместе с id объекта: с ними вебхук сверяет
+        оплату (core.events), даже если цены товаров менялись после
+        последнего пересчета заказа.
+        """
+        totals = order.get_totals()
+        return {
+            'subtotal_amount': totals.subtotal,
+            'tax_amount': totals.tax,
+            'discount_amount': totals.discount,
+            'total_amount': totals.total,
+        }
+
+    def get_checkout_session_fields(self, order, content_hash, session_id):
+        """Поля заказа, которые запоминают созданную Checkout Session."""
+        return {
+            'checkout_session_id': session_id,
+            'checkout_hash': content_hash,
+            'checkout_created_at': timezone.now(),
+            **self.get_totals_fields(order),
+        }
+
+    def get_payment_intent_fields(
+        self, order, content_hash, payment_intent_id
+    ):
+        """Поля заказа, которые запоминают созданный Payment Intent."""
+        return {
+            'payment_intent_id': payment_intent_id,
+            'payment_intent_hash': content_hash,
+            'payment_intent_created_at': timezone.now(),
+            **self.get_totals_fields(order),
+        }
+
+    def remember_checkout_session(self, order, content_hash, session_id):
+        Order.objects.filter(pk=order.pk).update(
+            **self.get_checkout_session_fields(
+                order, content_hash, session_id))
+
+    def remember_payment_intent(self, order, content_hash, intent):
+        Order.objects.filter(pk=order.pk).update(
+            **self.get_payment_intent_fields(
+                order, content_hash, intent.id))
+
+    def get_reusable_checkout_session(self, client, order, content_hash):
+        """Сохраненная Checkout Session заказа, если ее можно оплатить."""
+        session_id = self.get_reusable_checkout_session_id(
+            order, content_hash)
+        if session_id:
+            checkout_session = client.v1.checkout.sessions.retrieve(
+                session_id)
+            if self.is_checkout_session_reusable(checkout_session):
+                return checkout_session
+        return None
+
+    def get_reusable_payment_intent(self, client, order, content_hash):
+        """Сохраненный Payment Intent заказа, если его можно оплатить."""
+        payment_intent_id = self.get_reusable_payment_intent_id(
+            order, content_hash)
+        if payment_intent_id:
+            intent = client.v1.payment_intents.retrieve(payment_intent_id)
+            if self.is_payment_intent_reusable(intent):
+                return intent
+        return None
+
+
+class StripeOperationsMixin(
+    StripeKeysMixin,
+    StripeIdempotencyMixin,
+    CheckoutParamsMixin
+):
+    """Миксин с созданием объектов Stripe для товаров и заказов.
+
+    Возвращает тело успешного ответа. Общий для представлений и
+    фоновых задач (api/jobs.py); ошибки Stripe не перехватывает.
+    """
+
+    def coalesce(self, key, function):
+        """Одинаковые одновременные вызовы в процессе делят один
+        запрос к Stripe (api/throttling.py).
+
+        Только для заказа: его объект Stripe и так один на содержимое
+        заказа (ключ идемпотентности).
+        """
+        if not settings.STRIPE_COALESCE_REQUESTS:
+            return function()
+        return single_flight.do(key, function)
+
+    # Покупка товара не объединяется: Checkout Session и client_secret
+    # одноразовые, и каждому покупателю нужен свой объект.
+    def create_item_checkout_session(self, item, options=None):
+        client = self.get_stripe_client(item.currency)
+        checkout_session = client.v1.checkout.sessions.create(
+            self.get_item_checkout_params(item), options)
+        return {'id': checkout_session.id}
+
+    def create_item_payment_intent(self, item, options=None):
+        stripe_keys = self.get_stripe_keys(item.currency)
+        client = self.get_stripe_client(item.currency)
+        intent = client.v1.payment_intents.create(
+            self.get_item_payment_intent_params(item), options)
+        return {
+            'clientSecret': intent.client_secret,
+            'publishableKey': stripe_keys['publishable_key']
+        }
+
+    def create_order_checkout_session(self, order):
+        content_hash = order.get_content_hash()
+
+        def create():
+            client = self.get_stripe_client(order.get_currency())
+            checkout_session = self.get_reusable_checkout_session(
+                client, order, content_hash)
+            if checkout_session is None:
+                checkout_session = client.v1.checkout.sessions.create(
+                    self.get_order_checkout_params(order),
+                    self.get_idempotency_options(
+                        'checkout', order, content_hash,
+                        order.checkout_session_id)
+                )
+                self.remember_checkout_session(
+                    order, content_hash, checkout_session.id)
+            return {'id': checkout_session.id}
+
+        return self.coalesce(
+            f'order-checkout:{order.pk}:{content_hash}', create)
+
+    def create_order_payment_intent(self, order):
+        content_hash = order.get_content_hash()
+
+        def create():
+            currency = order.get_currency()
+            stripe_keys = self.get_stripe_keys(currency)
+            client = self.get_stripe_client(currency)
+            intent = self.get_reusable_payment_intent(
+                client, order, content_hash)
+            if intent is None:
+                intent = client.v1.payment_intents.create(
+                    self.get_order_payment_intent_params(order, currency),
+                    self.get_idempotency_options(
+                        'payment-intent', order, content_hash,
+                        order.payment_intent_id)
+                )
+                self.remember_payment_intent(order, content_hash, intent)
+            return {
+                'clientSecret': intent.client_secret,
+                'publishableKey': stripe_keys['publishable_key']
+            }
+
+        return self.coalesce(
+            f'order-payment-intent:{order.pk}:{content_hash}', create)
+
+
+class StripeJobMixin:
+    """Миксин для выполнения запроса к Stripe фоновой задачей.
+
+    Если задачи включены (STRIPE_JOBS_MODE) и клиент прислал заголовок
+    Prefer: respond-async, запрос отвечает 202 с адресом задачи, по
+    которому потом забирается результат.
+    """
+
+    def should_enqueue(self, request):
+        mode = settings.STRIPE_JOBS_MODE
+        if mode == 'always':
+            return True
+        return mode == 'prefer' and 'respond-async' in request.headers.get(
+            'Prefer', '')
+
+    def enqueue_response(self, kind, object_id):
+        from .jobs import enqueue_stripe_job
+
+        job = enqueue_stripe_job(kind, object_id)
+        url = reverse('stripe-job-detail', args=[job.pk])
+        response = Response(
+            {'job_id': str(job.pk), 'status': job.status, 'url': url},
+            status=status.HTTP_202_ACCEPTED
+        )
+        response.headers['Location'] = url
+        response.headers['Retry-After'] = str(
+            settings.STRIPE_JOBS_RETRY_AFTER)
+        return response
+
+
+class ConditionalGetMixin:
+    """Миксин для условных GET-запросов (ETag/Last-Modified)."""
+
+    def build_etag(self, *parts):
+        """Собирает ETag из значений, определяющих содержимое ответа."""
+        raw = '|'.join(str(part) for part in parts)
+        return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+    def get_not_modified_response(self, request, etag, last_modified=None):
+        """Возвращает 304, если у клиента актуальная версия, иначе None."""
+        return get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=(
+                int(last_modified.timestamp()) if last_modified else None
+            )
+        )
+
+    def set_conditional_headers(self, response, etag, last_modified=None):
+        """Добавляет в ответ заголовки ETag и Last-Modified."""
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(
+                last_modified.timestamp())
+        return response
+
+
+class CartMixin:
+    """Миксин для изменения позиций заказа (core.cart)."""
+
+    def cart_response(self, operation, order_id, *args):
+        """Выполняет операцию корзины и возвращает позицию и суммы.
+
+        Суммы — сохраненные суммы заказа после изменения, без
+        пересчета по всем позициям.
+        """
+        try:
+            quantity, totals = operation(order_id, *args)
+        except Order.DoesNotExist:
+            raise Http404('No Order matches the given query.')
+        except CartError as error:
+            return Response(
+                {'error': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'order_id': str(order_id),
+            'item_id': args[0],
+            'quantity': quantity,
+            'currency': totals['currency'],
+            'subtotal_price': from_cents(totals['subtotal_amount']),
+            'tax_price': from_cents(totals['tax_amount']),
+            'discount_price': from_cents(totals['discount_amount']),
+            'total_price': from_cents(totals['total_amount']),
+        }, status=status.HTTP_200_OK)
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class StreamingExportMixin:
+    """Миксин для потоковой выгрузки таблиц в NDJSON или CSV.
+
+    Строки читаются из БД порциями через .iterator(), поэтому память
+    не зависит от размера таблицы. Что выгружать, задает атрибут
+    export_queryset (как queryset у generic-представлений Django).
+    """
+
+    export_queryset = None
+    export_fields = ()
+    export_filename = 'export'
+    chunk_size = 2000
+    max_chunk_size = 10000
+
+    def get_export_queryset(self):
+        if self.export_queryset is None:
+            raise ImproperlyConfigured(
+                f'{type(self).__name__}: не задан export_queryset')
+        # all() — новая копия на каждый запрос, без общего кэша строк.
+        return self.export_queryset.all()
+
+    def get_chunk_size(self, request):
+        try:
+            chunk_size = int(request.GET.get('chunk_size', self.chunk_size))
+        except ValueError:
+            return self.chunk_size
+        return max(1, min(chunk_size, self.max_chunk_size))
+
+    def iter_rows(self, request):
+        return (
+            self.get_export_queryset()
+            .values_list(*self.export_fields)
+            .iterator(chunk_size=self.get_chunk_size(request))
+        )
+
+    def stream_ndjson(self, rows):
+        for row in rows:
+            yield json.dumps(
+                dict(zip(self.export_fields, row)),
+                cls=DjangoJSONEncoder,
+                ensure_ascii=False
+            ) + '\n'
+
+    def stream_csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'ndjson')
+        if export_format == 'csv':
+            content = self.stream_csv(self.iter_rows(request))
+            content_type = 'text/csv'
+        elif export_format == 'ndjson':
+            content = self.stream_ndjson(self.iter_rows(request))
+            content_type = 'application/x-ndjson'
+        else:
+            return JsonResponse(
+                {'error': f'Неподдерживаемый формат: {export_format}'},
+                status=400
+            )
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response.headers['Content-Disposition'] = (
+            f'attachment; filename="{self.export_filename}.{export_format}"')
+        return response
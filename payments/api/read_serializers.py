@@ -0,0 +1,97 @@
+"""Быстрые сериализаторы для чтения: строки .values() в JSON-типы.
+
+ItemSerializer и OrderSerializer на каждую строку проходят механику
+ModelSerializer: get_attribute и to_representation каждого поля,
+OrderedDict, вложенный сериализатор позиций. Здесь строки .values()
+переводятся в словари напрямую, а через поле DRF проходят только
+значения, у которых представление отличается от значения из БД (цены,
+даты). Результат совпадает с ответом сериализаторов DRF байт в байт,
+а в JSON его переводит FastJSONRenderer.
+
+Набор и порядок полей берутся из самих сериализаторов, поэтому новое
+поле в ItemSerializer или OrderSerializer нужно добавить и сюда.
+"""
+from functools import lru_cache
+
+from rest_framework import serializers
+
+from core.models import Order, OrderItem
+from core.pricing import from_cents
+from .metrics import measure
+from .serializers import ItemSerializer, OrderSerializer
+
+# Поля, которым нужно представление DRF; остальные отдаются как есть.
+CONVERTED_FIELDS = (serializers.DecimalField, serializers.DateTimeField)
+
+
+@lru_cache(maxsize=None)
+def get_item_fields(fields=None):
+    """Поля ItemSerializer в порядке ответа и их преобразования.
+
+    fields — кортеж полей из ?fields= (None — все поля).
+    """
+    serializer = ItemSerializer(fields=fields)
+    return tuple(serializer.fields), {
+        name: field.to_representation
+        for name, field in serializer.fields.items()
+        if isinstance(field, CONVERTED_FIELDS)
+    }
+
+
+def get_item_values(fields=None):
+    """Аргументы .values() для списка товаров: id нужен курсору."""
+    names, _ = get_item_fields(fields)
+    return ('id', *names) if 'id' not in names else names
+
+
+def serialize_items(rows, fields=None):
+    """Список товаров из строк .values(*get_item_values(fields))."""
+    names, converters = get_item_fields(fields)
+    with measure('serialize'):
+        data = [{name: row[name] for name in names} for row in rows]
+        for name, convert in converters.items():
+            for item in data:
+                item[name] = convert(item[name])
+    return data
+
+
+@lru_cache(maxsize=None)
+def get_created_at_representation():
+    return OrderSerializer().fields['created_at'].to_representation
+
+
+def get_order_row(order_id):
+    """Строка заказа с итоговой суммой из with_totals().
+
+    Пробрасывает Order.DoesNotExist.
+    """
+    return Order.objects.with_totals().values(
+        'id', 'discount_id', 'tax_id', 'currency', 'total_cents',
+        'created_at'
+    ).get(id=order_id)
+
+
+def get_order_items(order_id):
+    """Позиции заказа: пары (id товара, количество)."""
+    return list(OrderItem.objects.filter(
+        order_id=order_id).values_list('item_id', 'quantity'))
+
+
+def serialize_order(row, items):
+    """Заказ в том же виде, что OrderSerializer(order).data."""
+    with measure('serialize'):
+        return {
+            'id': str(row['id']),
+            'discount': row['discount_id'],
+            'tax': row['tax_id'],
+            'currency': row['currency'],
+            # Как у OrderSerializer: Decimal, который JSON-кодировщик DRF
+            # отдает числом.
+            'total_price': float(from_cents(row['total_cents'])),
+            'created_at': get_created_at_representation()(
+                row['created_at']),
+            'items': [
+                {'item_id': item_id, 'quantity': quantity}
+                for item_id, quantity in items
+            ],
+        }
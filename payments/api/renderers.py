@@ -0,0 +1,42 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+from .metrics import measure
+
+
+class MeasuredJSONRenderer(JSONRenderer):
+    """JSONRenderer, время которого учитывается как сериализация."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with measure('serialize'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FastJSONRenderer(MeasuredJSONRenderer):
+    """JSONRenderer на orjson для ответов из JSON-типов.
+
+    Для данных из api.read_serializers (str, int, float, None, списки и
+    словари) вывод совпадает с JSONRenderer байт в байт: тот же
+    компактный JSON без экранирования не-ASCII и с экранированными
+    U+2028/U+2029. Отступы (?format=json; indent=4), ASCII-вывод и
+    данные, которые orjson не кодирует (Decimal, datetime), уходят в
+    обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        with measure('serialize'):
+            try:
+                ret = orjson.dumps(data)
+            except TypeError:
+                ret = None
+        if ret is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
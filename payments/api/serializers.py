@@ -1,21 +1,92 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
 
-from core.models import Item, Order, OrderItem
+from core.cache import get_cached, get_many_cached
+from core.models import Currency, Discount, Item, Order, OrderItem, Tax
+from .metrics import measure
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class MeasuredDataMixin:
+    """Учитывает построение .data в метриках запроса (serialize)."""
+
+    @property
+    def data(self):
+        with measure('serialize'):
+            return super().data
+
+
+class MeasuredListSerializer(MeasuredDataMixin, serializers.ListSerializer):
+    pass
+
+
+class ItemSerializer(MeasuredDataMixin, serializers.ModelSerializer):
+    """Сериализатор для товаров.
+
+    Необязательный аргумент fields оставляет в ответе только
+    перечисленные поля.
+    """
+
     class Meta:
         model = Item
         fields = ('id', 'name', 'description', 'price', 'currency')
+        list_serializer_class = MeasuredListSerializer
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Связанное поле, которое читает объекты через кэш справочников.
+
+    При пакетном создании заказов дочерний сериализатор один на весь
+    пакет, поэтому одинаковые налоги и скидки не запрашиваются повторно
+    даже из кэша.
+    """
+
+    def to_internal_value(self, data):
+        objects = self.__dict__.setdefault('_objects', {})
+        key = str(data)
+        if key not in objects:
+            try:
+                objects[key] = self.get_cached_object(data)
+            except serializers.ValidationError as error:
+                objects[key] = error
+        if isinstance(objects[key], serializers.ValidationError):
+            raise objects[key]
+        return objects[key]
+
+    def get_cached_object(self, data):
+        model = self.get_queryset().model
+        try:
+            return get_cached(model, data)
+        except model.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class CartQuantitySerializer(serializers.Serializer):
+    """Количество товара при изменении позиции заказа."""
+
+    quantity = serializers.IntegerField(min_value=1)
+
+
+class CartItemSerializer(CartQuantitySerializer):
+    """Товар, добавляемый в заказ."""
+
+    item_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
     """Сериализатор для элементов заказа."""
 
-    item_id = serializers.PrimaryKeyRelatedField(
-        queryset=Item.objects.all(),
-        source='item'
-    )
+    item_id = serializers.IntegerField()
 
     class Meta:
         model = OrderItem
@@ -25,34 +96,131 @@ class OrderItemSerializer(serializers.ModelSerializer):
         }
 
 
-class OrderSerializer(serializers.ModelSerializer):
+def get_item_currencies(item_ids):
+    """Возвращает {id товара: валюта}; товары читаются через кэш.
+
+    Заодно проверяет, что все товары существуют.
+    """
+    currencies = {
+        item_id: item.currency
+        for item_id, item in get_many_cached(Item, item_ids).items()
+    }
+    missing = set(item_ids) - set(currencies)
+    if missing:
+        raise serializers.ValidationError(
+            'Товары не найдены: '
+            + ', '.join(str(item_id) for item_id in sorted(missing))
+        )
+    return currencies
+
+
+def get_order_currency(items_data, currencies):
+    """Валюта заказа: все товары должны быть в одной валюте."""
+    order_currencies = {
+        currencies[item_data['item_id']] for item_data in items_data}
+    if len(order_currencies) > 1:
+        raise serializers.ValidationError(
+            'Все товары заказа должны быть в одной валюте.')
+    return order_currencies.pop() if order_currencies else Currency.USD
+
+
+def build_order_items(order, items_data):
+    return [
+        OrderItem(
+            order=order,
+            item_id=item_data['item_id'],
+            quantity=item_data['quantity']
+        )
+        for item_data in items_data
+    ]
+
+
+class OrderListSerializer(MeasuredListSerializer):
+    """Пакетное создание заказов: два INSERT на весь пакет."""
+
+    def validate(self, attrs):
+        currencies = get_item_currencies({
+            item_data['item_id']
+            for order_data in attrs
+            for item_data in order_data['items']
+        })
+        for index, order_data in enumerate(attrs):
+            try:
+                order_data['currency'] = get_order_currency(
+                    order_data['items'], currencies)
+            except serializers.ValidationError as error:
+                raise serializers.ValidationError(
+                    f'Заказ {index}: {error.detail[0]}')
+        return attrs
+
+    def create(self, validated_data):
+        orders = []
+        order_items = []
+        for order_data in validated_data:
+            items_data = order_data.pop('items', [])
+            order = Order(**order_data)
+            orders.append(order)
+            order_items.extend(build_order_items(order, items_data))
+        with transaction.atomic():
+            Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create(order_items)
+            Order.objects.filter(
+                pk__in=[order.pk for order in orders]
+            ).recalculate_totals()
+        return orders
+
+
+class OrderSerializer(MeasuredDataMixin, serializers.ModelSerializer):
     """Сериализатор для заказа."""
 
     items = OrderItemSerializer(many=True, write_only=True)
     total_price = serializers.SerializerMethodField()
+    discount = CachedPrimaryKeyRelatedField(
+        queryset=Discount.objects.all(), required=False, allow_null=True)
+    tax = CachedPrimaryKeyRelatedField(
+        queryset=Tax.objects.all(), required=False, allow_null=True)
 
     class Meta:
         model = Order
         fields = (
-            'id', 'items', 'discount', 'tax', 'total_price', 'created_at')
-        read_only_fields = ['id', 'total_price', 'created_at']
+            'id', 'items', 'discount', 'tax', 'currency', 'total_price',
+            'created_at'
+        )
+        read_only_fields = ['id', 'currency', 'total_price', 'created_at']
+        list_serializer_class = OrderListSerializer
 
     def get_total_price(self, obj):
         """Рассчитывает общую сумму заказа"""
         return obj.get_total_price()
 
+    def validate_items(self, items):
+        item_ids = [item_data['item_id'] for item_data in items]
+        if len(set(item_ids)) != len(item_ids):
+            raise serializers.ValidationError(
+                'Товары в заказе не должны повторяться.')
+        return items
+
+    def validate(self, attrs):
+        # В пакете товары проверяются одним запросом в OrderListSerializer.
+        if isinstance(self.parent, serializers.ListSerializer):
+            return attrs
+        try:
+            currencies = get_item_currencies(
+                [item_data['item_id'] for item_data in attrs['items']])
+            attrs['currency'] = get_order_currency(
+                attrs['items'], currencies)
+        except serializers.ValidationError as error:
+            raise serializers.ValidationError({'items': error.detail})
+        return attrs
+
     def create(self, validated_data):
         """Создание заказа с элементами"""
         items_data = validated_data.pop('items', [])
-        # Создаем заказ.
-        order = Order.objects.create(**validated_data)
-        # Создаем элементы заказа.
-        for item_data in items_data:
-            OrderItem.objects.create(
-                order=order,
-                item=item_data['item'],
-                quantity=item_data['quantity']
-            )
+        with transaction.atomic():
+            order = Order.objects.create(**validated_data)
+            OrderItem.objects.bulk_create(
+                build_order_items(order, items_data))
+            Order.objects.filter(pk=order.pk).recalculate_totals()
         return order
 
     def to_representation(self, instance):
@@ -0,0 +1,166 @@
+"""Реестр Stripe-клиентов с пулом HTTP-соединений.
+
+Для каждого секретного ключа (аккаунта) в процессе создается один
+stripe.StripeClient со своей requests.Session. Соединения с API Stripe
+переиспользуются между запросами (keep-alive), а глобальный
+stripe.api_key не меняется, поэтому клиенты безопасны для потоков.
+
+Асинхронные клиенты (httpx) привязаны к event loop, поэтому хранятся
+отдельно для каждого loop: под ASGI это один пул на воркер.
+
+Оба HTTP-клиента учитывают число и время вызовов Stripe в метриках
+запроса (api/metrics.py) и перед каждым вызовом берут токен у
+ограничителя частоты аккаунта (api/throttling.py).
+"""
+import asyncio
+import ssl
+import threading
+import weakref
+
+import anyio
+import httpx
+import requests
+import stripe
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .metrics import measure
+from .throttling import get_rate_limiter
+
+_clients = {}
+_sessions = {}
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+class InstrumentedRequestsClient(stripe.RequestsClient):
+    """HTTP-клиент Stripe с ограничением частоты и метриками."""
+
+    def __init__(self, rate_limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+
+    def request(self, *args, **kwargs):
+        if self.rate_limiter:
+            with measure('stripe_wait'):
+                self.rate_limiter.acquire()
+        with measure('stripe'):
+            return super().request(*args, **kwargs)
+
+
+class PooledHTTPXClient(stripe.HTTPXClient):
+    """Асинхронный HTTP-клиент Stripe с ограниченным пулом соединений.
+
+    HTTPXClient.__init__ не принимает limits и сразу создает свой
+    httpx.AsyncClient, который здесь пришлось бы выбросить незакрытым.
+    Поэтому вызывается только базовый stripe.HTTPClient.__init__, а
+    поля HTTPXClient (stripe==14.1.0, см. requirements.txt) задаются
+    здесь, с одним AsyncClient с нужным пулом.
+    """
+
+    def __init__(self, timeout, pool_size, rate_limiter=None, **kwargs):
+        stripe.HTTPClient.__init__(self, **kwargs)
+        self.httpx = httpx
+        self.anyio = anyio
+        self._client = None
+        self._timeout = timeout
+        self.rate_limiter = rate_limiter
+        self._client_async = self.httpx.AsyncClient(
+            verify=(
+                ssl.create_default_context(cafile=stripe.ca_bundle_path)
+                if self._verify_ssl_certs else False
+            ),
+            limits=self.httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+            ),
+        )
+
+    async def request_async(self, *args, **kwargs):
+        if self.rate_limiter:
+            with measure('stripe_wait'):
+                await self.rate_limiter.aacquire()
+        with measure('stripe'):
+            return await super().request_async(*args, **kwargs)
+
+
+def create_http_session():
+    """Создает requests.Session с пулом keep-alive соединений."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.STRIPE_HTTP_POOL_SIZE,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_stripe_client(secret_key, http_client):
+    """Создает Stripe-клиент поверх переданного HTTP-клиента."""
+    base_addresses = (
+        {'api': settings.STRIPE_API_BASE} if settings.STRIPE_API_BASE
+        else None
+    )
+    return stripe.StripeClient(
+        secret_key,
+        base_addresses=base_addresses,
+        max_network_retries=settings.STRIPE_MAX_NETWORK_RETRIES,
+        http_client=http_client,
+    )
+
+
+def get_stripe_client(secret_key):
+    """Возвращает общий для процесса Stripe-клиент для ключа."""
+    client = _clients.get(secret_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(secret_key)
+            if client is None:
+                session = create_http_session()
+                client = create_stripe_client(
+                    secret_key,
+                    InstrumentedRequestsClient(
+                        timeout=(
+                            settings.STRIPE_HTTP_CONNECT_TIMEOUT,
+                            settings.STRIPE_HTTP_READ_TIMEOUT,
+                        ),
+                        session=session,
+                        rate_limiter=get_rate_limiter(secret_key),
+                    )
+                )
+                _sessions[secret_key] = session
+                _clients[secret_key] = client
+    return client
+
+
+def get_async_stripe_client(secret_key):
+    """Возвращает Stripe-клиент для *_async методов в текущем event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(secret_key)
+        if client is None:
+            client = create_stripe_client(
+                secret_key,
+                PooledHTTPXClient(
+                    timeout=httpx.Timeout(
+                        settings.STRIPE_HTTP_READ_TIMEOUT,
+                        connect=settings.STRIPE_HTTP_CONNECT_TIMEOUT,
+                    ),
+                    pool_size=settings.STRIPE_HTTP_ASYNC_POOL_SIZE,
+                    rate_limiter=get_rate_limiter(secret_key),
+                )
+            )
+            clients[secret_key] = client
+    return client
+
+
+def reset_stripe_clients():
+    """Закрывает и сбрасывает все клиенты (смена ключей, тесты)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _clients.clear()
+        _async_clients.clear()
@@ -0,0 +1,147 @@
+"""Бюджет запросов к БД для заказов: список, карточка и оплата.
+
+Число запросов не должно зависеть от числа заказов и позиций: граф
+заказа загружается заранее (OrderQuerySet.with_related()), суммы
+считаются одним SQL (with_totals()) или берутся из сохраненных полей.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Discount, Item, Order, OrderItem, Tax
+from .mixins import (
+    CheckoutParamsMixin,
+    OrderRetrievalMixin,
+    StripeKeysMixin,
+)
+
+
+def create_order(items, tax=None, discount=None):
+    order = Order.objects.create(tax=tax, discount=discount)
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, item=item, quantity=index + 1)
+        for index, item in enumerate(items)
+    )
+    Order.objects.filter(pk=order.pk).recalculate_totals()
+    return order
+
+
+class OrderQueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tax = Tax.objects.create(name='VAT', rate=Decimal('20.00'))
+        cls.discount = Discount.objects.create(
+            name='Sale', percent_off=Decimal('10.00'))
+        cls.items = [
+            Item.objects.create(
+                name=f'Item {index}',
+                description='',
+                price=Decimal('9.99') + index,
+                currency='usd',
+            )
+            for index in range(5)
+        ]
+        cls.small_order = create_order(cls.items[:1])
+        cls.large_order = create_order(cls.items, cls.tax, cls.discount)
+        cls.admin = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def test_order_detail(self):
+        for order in (self.small_order, self.large_order):
+            with self.subTest(lines=order.order_items.count()):
+                with self.assertNumQueries(2):
+                    response = self.client.get(
+                        reverse('order-detail', args=[order.pk]),
+                        HTTP_ACCEPT='application/json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.json()['items']),
+                    order.order_items.count()
+                )
+
+    def test_order_for_stripe(self):
+        """Заказ для оплаты: два запроса, дальше все из памяти."""
+        view = type(
+            'View', (OrderRetrievalMixin, CheckoutParamsMixin), {})()
+        for order_id in (self.small_order.pk, self.large_order.pk):
+            with self.assertNumQueries(2):
+                order = view.get_order(order_id)
+            with self.assertNumQueries(0):
+                view.get_order_checkout_params(order)
+                view.get_order_payment_intent_params(
+                    order, order.get_currency())
+                order.get_content_hash()
+                order.get_total_price()
+
+    @mock.patch('api.mixins.get_stripe_client')
+    @mock.patch.object(StripeKeysMixin, 'get_stripe_keys', return_value={
+        'publishable_key': 'pk_test', 'secret_key': 'sk_test'})
+    def test_order_checkout(self, get_stripe_keys, get_stripe_client):
+        """Оплата заказа: заказ (два запроса) и запись объекта Stripe.
+
+        Ключи и клиент Stripe заменены заглушками; повторный запрос
+        берет сохраненную сессию без записи в БД.
+        """
+        client = get_stripe_client.return_value
+        client.v1.checkout.sessions.create.return_value = SimpleNamespace(
+            id='cs_test')
+        client.v1.checkout.sessions.retrieve.return_value = SimpleNamespace(
+            id='cs_test', status='open')
+        client.v1.payment_intents.create.return_value = SimpleNamespace(
+            id='pi_test', client_secret='pi_test_secret')
+        for order in (self.small_order, self.large_order):
+            with self.subTest(lines=order.order_items.count()):
+                url = reverse('order-checkout', args=[order.pk])
+                with self.assertNumQueries(3):
+                    response = self.client.get(url)
+                self.assertEqual(response.json(), {'id': 'cs_test'})
+                with self.assertNumQueries(2):
+                    self.client.get(url)
+                with self.assertNumQueries(3):
+                    response = self.client.post(
+                        reverse('order-payment-intent', args=[order.pk]))
+                self.assertEqual(
+                    response.json()['clientSecret'], 'pi_test_secret')
+
+    def test_order_export(self):
+        for _ in range(3):
+            create_order(self.items[:2])
+        self.client.force_login(self.admin)
+        # Сессия, пользователь и один запрос заказов.
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                reverse('order-export'), {'format': 'ndjson'})
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), Order.objects.count())
+
+    # Манифест collectstatic для шаблонов админки в тестах не нужен.
+    @override_settings(STORAGES={
+        'default': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {
+            'BACKEND':
+                'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_admin_order_list(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:core_order_changelist')
+        self.client.get(url)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for _ in range(5):
+            create_order(self.items, self.tax)
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertContains(response, str(self.large_order.pk))
@@ -0,0 +1,168 @@
+"""Ограничение частоты и объединение запросов к Stripe.
+
+StripeRateLimiter — token bucket на аккаунт Stripe. Состояние корзины
+хранится в кэше, поэтому лимит общий для всех воркеров, если кэш общий
+(Redis); с LocMemCache лимит действует в пределах процесса. Запрос без
+свободного токена не падает, а занимает токен в долг и ждет его
+появления, но не дольше STRIPE_RATE_LIMIT_MAX_WAIT секунд: дальше
+ожидание не имеет смысла и запрос получает StripeRateLimitExceeded.
+Корзина меняется под блокировкой в кэше; снимает ее только владелец.
+
+SingleFlight и AsyncSingleFlight объединяют одинаковые одновременные
+запросы процесса: первый выполняет вызов, остальные ждут и получают
+его результат (или его ошибку). Применяются только к оплате заказа,
+где результат и так общий для всех запросов; между процессами дубли
+по заказу схлопывает сам Stripe по ключу идемпотентности.
+"""
+import asyncio
+import hashlib
+import math
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import Future
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+# Блокировка корзины держится микросекунды; срок нужен на случай, если
+# процесс умрет, не сняв ее.
+LOCK_TIMEOUT = 1
+LOCK_POLL_INTERVAL = 0.001
+
+
+class StripeRateLimitExceeded(stripe.error.RateLimitError):
+    """Лимит запросов к аккаунту Stripe исчерпан дольше допустимого
+    ожидания. Наследует RateLimitError, поэтому обрабатывается так же,
+    как 429 от самого Stripe."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            'Слишком много запросов к платежной системе, '
+            'повторите попытку позже.'
+        )
+        self.retry_after = retry_after
+
+
+class StripeRateLimiter:
+    """Token bucket: rate токенов в секунду, не больше burst подряд."""
+
+    def __init__(self, account, rate, burst, max_wait):
+        self.key = f'stripe-rate:{account}'
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+
+    def lock(self):
+        """Берет блокировку корзины и возвращает ее токен.
+
+        Без блокировки корзину менять нельзя: если ее не удалось взять
+        за LOCK_TIMEOUT, запрос получает StripeRateLimitExceeded.
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not cache.add(self.key + ':lock', token, LOCK_TIMEOUT):
+            # Блокировку упавшего процесса снимет срок ее хранения.
+            if time.monotonic() > deadline:
+                raise StripeRateLimitExceeded(retry_after=LOCK_TIMEOUT)
+            time.sleep(LOCK_POLL_INTERVAL)
+        return token
+
+    def unlock(self, token):
+        """Снимает блокировку, только если она все еще наша.
+
+        Блокировку с истекшим сроком мог уже взять другой процесс.
+        """
+        if cache.get(self.key + ':lock') == token:
+            cache.delete(self.key + ':lock')
+
+    def reserve(self):
+        """Занимает токен и возвращает, сколько секунд ждать его."""
+        token = self.lock()
+        try:
+            now = time.time()
+            tokens, updated = cache.get(self.key) or (self.burst, now)
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = max(0.0, (1 - tokens) / self.rate)
+            if wait > self.max_wait:
+                raise StripeRateLimitExceeded(retry_after=wait)
+            # Корзина без долга заполнится за burst / rate секунд.
+            cache.set(
+                self.key, (tokens - 1, now),
+                math.ceil((self.burst - tokens + 1) / self.rate) + 1
+            )
+        finally:
+            self.unlock(token)
+        return wait
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = await sync_to_async(self.reserve, thread_sensitive=False)()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+def get_rate_limiter(secret_key):
+    """Ограничитель аккаунта или None, если лимит выключен."""
+    if not settings.STRIPE_RATE_LIMIT:
+        return None
+    # В ключе кэша — хэш, а не сам секретный ключ.
+    account = hashlib.sha256(secret_key.encode()).hexdigest()[:16]
+    return StripeRateLimiter(
+        account,
+        settings.STRIPE_RATE_LIMIT,
+        settings.STRIPE_RATE_LIMIT_BURST or settings.STRIPE_RATE_LIMIT,
+        settings.STRIPE_RATE_LIMIT_MAX_WAIT,
+    )
+
+
+class SingleFlight:
+    """Один вызов на ключ среди потоков процесса."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, function):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(function())
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return future.result()
+
+
+class AsyncSingleFlight:
+    """Один вызов на ключ среди корутин event loop."""
+
+    def __init__(self):
+        self.calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, coroutine_function):
+        calls = self.calls.setdefault(asyncio.get_running_loop(), {})
+        task = calls.get(key)
+        if task is None:
+            task = calls[key] = asyncio.ensure_future(coroutine_function())
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        # shield: отмена одного ожидающего не отменяет общий вызов.
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
@@ -1,15 +1,30 @@
 from django.urls import path
 
+from .async_views import (
+    AsyncCreateCheckoutSessionView,
+    AsyncCreatePaymentIntentView,
+    AsyncOrderCheckoutSessionView,
+    AsyncOrderPaymentIntentView,
+)
 from .views import (
     CancelView,
     CreateCheckoutSessionView,
     CreatePaymentIntentView,
     ItemDetailView,
+    ItemExportView,
     ItemListView,
+    MetricsView,
+    OrderBatchCreateView,
     OrderCheckoutSessionView,
     OrderCreateView,
     OrderDetailView,
+    OrderItemView,
+    OrderItemsView,
+    OrderExportView,
     OrderPaymentIntentView,
+    ReferenceCacheStatsView,
+    StripeJobDetailView,
+    StripeWebhookView,
     SuccessView,
 )
 
@@ -17,6 +32,11 @@ urlpatterns = [
     path(
         'item/<int:id>/', ItemDetailView.as_view(), name='item-detail'),
     path('success/', SuccessView.as_view(), name='success'),
+    path(
+        'webhooks/stripe/',
+        StripeWebhookView.as_view(),
+        name='stripe-webhook'
+    ),
     path('cancel/', CancelView.as_view(), name='cancel'),
     path(
         'buy/<int:id>/',
@@ -38,11 +58,64 @@ urlpatterns = [
         OrderPaymentIntentView.as_view(),
         name='order-payment-intent'
     ),
+    path(
+        'async/buy/<int:id>/',
+        AsyncCreateCheckoutSessionView.as_view(),
+        name='async-create-checkout-session'
+    ),
+    path(
+        'async/payment-intent/<int:id>/',
+        AsyncCreatePaymentIntentView.as_view(),
+        name='async-create-payment-intent'
+    ),
+    path(
+        'async/order/<uuid:order_id>/checkout/',
+        AsyncOrderCheckoutSessionView.as_view(),
+        name='async-order-checkout'
+    ),
+    path(
+        'async/order/<uuid:order_id>/payment-intent/',
+        AsyncOrderPaymentIntentView.as_view(),
+        name='async-order-payment-intent'
+    ),
+    path(
+        'api/cache/stats/',
+        ReferenceCacheStatsView.as_view(),
+        name='reference-cache-stats'
+    ),
+    path(
+        'api/jobs/<uuid:job_id>/',
+        StripeJobDetailView.as_view(),
+        name='stripe-job-detail'
+    ),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/items/', ItemListView.as_view(), name='item-list'),
+    path(
+        'api/items/export/', ItemExportView.as_view(), name='item-export'),
     path('api/orders/', OrderCreateView.as_view(), name='order-create'),
+    path(
+        'api/orders/batch/',
+        OrderBatchCreateView.as_view(),
+        name='order-batch-create'
+    ),
+    path(
+        'api/orders/export/',
+        OrderExportView.as_view(),
+        name='order-export'
+    ),
     path(
         'api/orders/<uuid:order_id>/',
         OrderDetailView.as_view(),
         name='order-detail'
     ),
+    path(
+        'api/orders/<uuid:order_id>/items/',
+        OrderItemsView.as_view(),
+        name='order-items'
+    ),
+    path(
+        'api/orders/<uuid:order_id>/items/<int:item_id>/',
+        OrderItemView.as_view(),
+        name='order-item'
+    ),
 ]
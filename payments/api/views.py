@@ -1,46 +1,117 @@
+import json
+from datetime import datetime, timezone
+
 import stripe
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.views import View
 from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from core.models import Item, Order
+from core.cache import get_stats
+from core.cart import add_item, remove_item, set_item_quantity
+from core.models import (
+    Item,
+    Order,
+    StripeEvent,
+    StripeJob,
+    StripeJobKind,
+    StripeJobStatus,
+)
+from core.stripe_accounts import get_registry
+from .metrics import measure, registry
 from .mixins import (
-    DiscountTaxMixin,
+    CartMixin,
+    ConditionalGetMixin,
     ItemRetrievalMixin,
-    LineItemsMixin,
     OrderRetrievalMixin,
+    StreamingExportMixin,
     StripeErrorHandlerMixin,
+    StripeJobMixin,
     StripeKeysMixin,
+    StripeOperationsMixin,
+)
+from .pagination import ItemCursorPagination
+from .read_serializers import (
+    get_item_values,
+    get_order_items,
+    get_order_row,
+    serialize_items,
+    serialize_order,
+)
+from .renderers import FastJSONRenderer
+from .serializers import (
+    CartItemSerializer,
+    CartQuantitySerializer,
+    ItemSerializer,
+    OrderSerializer,
 )
-from .serializers import ItemSerializer, OrderSerializer
 
 
 class ItemDetailView(
     StripeKeysMixin,
+    ItemRetrievalMixin,
+    ConditionalGetMixin,
     View
 ):
-    """Отображает страницу с информацией о товаре."""
+    """Отображает страницу с информацией о товаре.
+
+    Готовый HTML хранится в кэше под ключом из id товара и updated_at,
+    поэтому сохранение товара сразу дает новую страницу. Браузеры и CDN
+    перепроверяют ее по ETag и получают 304 без рендеринга.
+    """
+
+    template_name = 'items/item_detail.html'
 
     def get(self, request, id):
-        item = get_object_or_404(Item, id=id)
+        item = self.get_item(id)
         stripe_keys = self.get_stripe_keys(item.currency)
-
-        context = {
-            'item': item,
-            'stripe_publishable_key': stripe_keys['publishable_key'],
-            'domain': settings.DOMAIN,
-        }
-        return render(request, 'items/item_detail.html', context)
+        etag = self.build_etag(
+            item.pk, item.updated_at, stripe_keys['publishable_key'],
+            settings.DOMAIN
+        )
+        response = self.get_not_modified_response(
+            request, etag, item.updated_at)
+        if response is None:
+            response = HttpResponse(
+                self.get_page(request, item, stripe_keys, etag))
+        self.set_conditional_headers(response, etag, item.updated_at)
+        patch_cache_control(
+            response, public=True, max_age=settings.ITEM_PAGE_MAX_AGE)
+        return response
+
+    def get_page(self, request, item, stripe_keys, etag):
+        cache_key = 'item-page:' + etag.strip('"')
+        page = cache.get(cache_key)
+        if page is None:
+            context = {
+                'item': item,
+                'stripe_publishable_key': stripe_keys['publishable_key'],
+                'domain': settings.DOMAIN,
+            }
+            with measure('render'):
+                page = render_to_string(
+                    self.template_name, context, request)
+            cache.set(cache_key, page, settings.ITEM_PAGE_CACHE_TIMEOUT)
+        return page
 
 
 class CreateCheckoutSessionView(
-    StripeKeysMixin,
     StripeErrorHandlerMixin,
+    StripeJobMixin,
+    StripeOperationsMixin,
     ItemRetrievalMixin,
-    LineItemsMixin,
     APIView
 ):
     """Создание Stripe Checkout Session для одного товара."""
@@ -53,17 +124,13 @@ class CreateCheckoutSessionView(
                 {'error': 'Валюта товара не определена'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if self.should_enqueue(request):
+            return self.enqueue_response(StripeJobKind.ITEM_CHECKOUT, item.pk)
         try:
-            self.set_stripe_api_key(item.currency)
-            checkout_session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[self.create_item_line_item(item)],
-                mode='payment',
-                success_url=f'{settings.DOMAIN}/success/',
-                cancel_url=f'{settings.DOMAIN}/cancel/',
-            )
             return Response(
-                {'id': checkout_session.id}, status=status.HTTP_200_OK)
+                self.create_item_checkout_session(item),
+                status=status.HTTP_200_OK
+            )
         except stripe.error.StripeError as e:
             return self.handle_stripe_error(e)
         except Exception as e:
@@ -74,8 +141,9 @@ class CreateCheckoutSessionView(
 
 
 class CreatePaymentIntentView(
-    StripeKeysMixin,
     StripeErrorHandlerMixin,
+    StripeJobMixin,
+    StripeOperationsMixin,
     ItemRetrievalMixin,
     APIView
 ):
@@ -83,19 +151,14 @@ class CreatePaymentIntentView(
 
     def get(self, request, id):
         item = self.get_item(id)
-        stripe_keys = self.set_stripe_api_key(item.currency)
-
+        if self.should_enqueue(request):
+            return self.enqueue_response(
+                StripeJobKind.ITEM_PAYMENT_INTENT, item.pk)
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(item.price * 100),
-                currency=item.currency,
-                metadata={'item_id': item.id},
-                automatic_payment_methods={'enabled': True},
+            return Response(
+                self.create_item_payment_intent(item),
+                status=status.HTTP_200_OK
             )
-            return Response({
-                'clientSecret': intent.client_secret,
-                'publishableKey': stripe_keys['publishable_key']
-            }, status=status.HTTP_200_OK)
         except stripe.error.StripeError as e:
             return self.handle_stripe_error(e)
         except Exception as e:
@@ -103,43 +166,28 @@ class CreatePaymentIntentView(
 
 
 class OrderCheckoutSessionView(
-    StripeKeysMixin,
     StripeErrorHandlerMixin,
+    StripeJobMixin,
+    StripeOperationsMixin,
     OrderRetrievalMixin,
-    LineItemsMixin,
-    DiscountTaxMixin,
     APIView
 ):
     """Создает Checkout Session для Order с несколькими товарами"""
 
     def get(self, request, order_id):
         order = self.get_order(order_id)
-        currency = order.get_currency()
-        self.set_stripe_api_key(currency)
-
+        # Уже созданная сессия проверяется и отдается без задачи.
+        if self.should_enqueue(request) and not (
+            self.get_reusable_checkout_session_id(
+                order, order.get_content_hash())
+        ):
+            return self.enqueue_response(
+                StripeJobKind.ORDER_CHECKOUT, order.pk)
         try:
-            checkout_params = {
-                'payment_method_types': ['card'],
-                'line_items': self.create_order_line_items(order),
-                'mode': 'payment',
-                'success_url': f'{settings.DOMAIN}/success/',
-                'cancel_url': f'{settings.DOMAIN}/cancel/',
-                'metadata': {'order_id': str(order.id)},
-            }
-            # Добавляем скидку если есть.
-            discounts = self.get_discount_params(order)
-            if discounts:
-                checkout_params['discounts'] = discounts
-            # Добавляем параметры налогов.
-            tax_params = self.get_tax_params(order)
-            checkout_params.update(tax_params)
-            tax_rates = self.get_tax_rates(order)
-            if tax_rates:
-                checkout_params['tax_rates'] = tax_rates
-            checkout_session = stripe.checkout.Session.create(
-                **checkout_params)
             return Response(
-                {'id': checkout_session.id}, status=status.HTTP_200_OK)
+                self.create_order_checkout_session(order),
+                status=status.HTTP_200_OK
+            )
         except stripe.error.StripeError as e:
             return self.handle_stripe_error(e)
         except Exception as e:
@@ -147,49 +195,27 @@ class OrderCheckoutSessionView(
 
 
 class OrderPaymentIntentView(
-    StripeKeysMixin,
     StripeErrorHandlerMixin,
+    StripeJobMixin,
+    StripeOperationsMixin,
     OrderRetrievalMixin,
-    DiscountTaxMixin,
     APIView
 ):
     """Создает Payment Intent для Order"""
 
     def post(self, request, order_id):
         order = self.get_order(order_id)
-        currency = order.get_currency()
-        stripe_keys = self.get_stripe_keys(currency)
-        stripe.api_key = stripe_keys['secret_key']
+        if self.should_enqueue(request) and not (
+            self.get_reusable_payment_intent_id(
+                order, order.get_content_hash())
+        ):
+            return self.enqueue_response(
+                StripeJobKind.ORDER_PAYMENT_INTENT, order.pk)
         try:
-            # Рассчитываем сумму в центах.
-            total_amount = int(order.get_total_price() * 100)
-            intent_params = {
-                'amount': total_amount,
-                'currency': currency,
-                'metadata': {'order_id': str(order.id)},
-                'automatic_payment_methods': {'enabled': True},
-            }
-            if order.tax:
-                # Рассчитываем сумму без налога и налог отдельно.
-                subtotal = sum(
-                    float(item.price) * quantity
-                    for item, quantity in
-                    order.order_items.values_list('item', 'quantity')
-                )
-                tax_amount = subtotal * (order.tax.rate / 100)
-                intent_params['amount'] = int((subtotal + tax_amount) * 100)
-                intent_params['description'] = (
-                    f'{order.tax.rate}% {order.tax.name}')
-            # Если есть скидка
-            if order.discount and order.discount.coupon_id:
-                intent_params['discounts'] = [{
-                    'coupon': order.discount.coupon_id
-                }]
-            intent = stripe.PaymentIntent.create(**intent_params)
-            return Response({
-                'clientSecret': intent.client_secret,
-                'publishableKey': stripe_keys['publishable_key']
-            }, status=status.HTTP_200_OK)
+            return Response(
+                self.create_order_payment_intent(order),
+                status=status.HTTP_200_OK
+            )
         except stripe.error.StripeError as e:
             return self.handle_stripe_error(e)
         except Exception as e:
@@ -199,13 +225,77 @@ class OrderPaymentIntentView(
             )
 
 
-class ItemListView(APIView):
-    """Получает список товаров."""
+class StripeJobDetailView(APIView):
+    """Состояние фоновой задачи Stripe.
+
+    Отвечает сразу, не дожидаясь задачи: пока она не завершена, в
+    ответе есть Retry-After — через сколько секунд спросить снова.
+    """
+
+    finished_statuses = (StripeJobStatus.SUCCEEDED, StripeJobStatus.FAILED)
+
+    def get(self, request, job_id):
+        job = get_object_or_404(StripeJob, pk=job_id)
+        response = Response({
+            'job_id': str(job.pk),
+            'kind': job.kind,
+            'status': job.status,
+            'attempts': job.attempts,
+            'result': job.result,
+            'error': job.error,
+        }, status=status.HTTP_200_OK)
+        if job.status not in self.finished_statuses:
+            response.headers['Retry-After'] = str(
+                settings.STRIPE_JOBS_RETRY_AFTER)
+        return response
+
+
+class ItemListView(ConditionalGetMixin, APIView):
+    """Получает список товаров.
+
+    Постраничный вывод по курсору, фильтр ?currency=, выбор полей
+    ?fields=id,name. Повторный запрос с If-None-Match получает 304 без
+    сериализации товаров. Last-Modified не отдается: Max(updated_at) не
+    меняется при удалении товара, а ETag учитывает и число товаров.
+    Товары читаются через .values() и сериализуются api.read_serializers.
+    """
+
+    pagination_class = ItemCursorPagination
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
 
     def get(self, request):
+        fields = request.query_params.get('fields')
+        if fields:
+            fields = [name.strip() for name in fields.split(',')]
+            unknown = set(fields) - set(ItemSerializer.Meta.fields)
+            if unknown:
+                return Response(
+                    {'error': f'Неизвестные поля: {", ".join(unknown)}'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
         items = Item.objects.all()
-        serializer = ItemSerializer(items, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        currency = request.query_params.get('currency')
+        if currency:
+            items = items.filter(currency=currency.lower())
+
+        state = items.aggregate(
+            updated_at=Max('updated_at'), count=Count('id'))
+        etag = self.build_etag(
+            request.get_full_path(), state['count'], state['updated_at'])
+        not_modified = self.get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        if fields:
+            fields = tuple(
+                name for name in ItemSerializer.Meta.fields if name in fields)
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(
+            items.values(*get_item_values(fields)), request, view=self)
+        response = paginator.get_paginated_response(
+            serialize_items(page, fields))
+        return self.set_conditional_headers(response, etag)
 
 
 class OrderCreateView(APIView):
@@ -215,6 +305,8 @@ class OrderCreateView(APIView):
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
             order = serializer.save()
+            order = Order.objects.with_related().with_totals().get(
+                pk=order.pk)
             return Response(
                 OrderSerializer(order).data,
                 status=status.HTTP_201_CREATED
@@ -222,24 +314,209 @@ class OrderCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class OrderBatchCreateView(APIView):
+    """Создает пакет заказов одним запросом."""
+
+    max_batch_size = 500
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response(
+                {'error': 'Ожидается список заказов'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(request.data) > self.max_batch_size:
+            return Response(
+                {'error': f'Не более {self.max_batch_size} заказов за раз'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        serializer = OrderSerializer(data=request.data, many=True)
+        if serializer.is_valid():
+            order_ids = [order.pk for order in serializer.save()]
+            orders = Order.objects.with_related().with_totals().in_bulk(
+                order_ids)
+            return Response(
+                OrderSerializer(
+                    [orders[order_id] for order_id in order_ids], many=True
+                ).data,
+                status=status.HTTP_201_CREATED
+            )
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class OrderItemsView(CartMixin, APIView):
+    """Добавляет товар в существующий заказ."""
+
+    def post(self, request, order_id):
+        serializer = CartItemSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.cart_response(
+            add_item, order_id,
+            serializer.validated_data['item_id'],
+            serializer.validated_data['quantity'],
+        )
+
+
+class OrderItemView(CartMixin, APIView):
+    """Меняет количество товара в заказе или удаляет его."""
+
+    def patch(self, request, order_id, item_id):
+        serializer = CartQuantitySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.cart_response(
+            set_item_quantity, order_id, item_id,
+            serializer.validated_data['quantity'],
+        )
+
+    def delete(self, request, order_id, item_id):
+        return self.cart_response(remove_item, order_id, item_id)
+
+
 class OrderDetailView(APIView):
-    """Получает детали заказа."""
+    """Получает детали заказа.
+
+    Ответ тот же, что у OrderSerializer, но собирается из строк
+    .values() двумя запросами (api.read_serializers).
+    """
+
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
 
     def get(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id)
-        serializer = OrderSerializer(order)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            row = get_order_row(order_id)
+        except Order.DoesNotExist:
+            raise Http404('No Order matches the given query.')
+        return Response(
+            serialize_order(row, get_order_items(order_id)),
+            status=status.HTTP_200_OK
+        )
 
 
-class SuccessView(View):
-    """Возрващает страницу успешной оплаты."""
+@method_decorator(staff_member_required, name='dispatch')
+class ReferenceCacheStatsView(View):
+    """Счетчики попаданий и промахов кэша справочных данных."""
 
     def get(self, request):
-        return render(request, 'items/success.html')
+        return JsonResponse(get_stats())
 
 
-class CancelView(View):
-    """Возрващает страницу отмены оплаты."""
+class MetricsView(View):
+    """Гистограммы процесса в текстовом формате Prometheus.
+
+    Если задан METRICS_TOKEN, нужен заголовок
+    Authorization: Bearer <токен>, иначе — вход сотрудника.
+    """
 
     def get(self, request):
-        return render(request, 'items/cancel.html')
+        if not self.has_access(request):
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+
+    def has_access(self, request):
+        if settings.METRICS_TOKEN:
+            return constant_time_compare(
+                request.headers.get('Authorization', ''),
+                f'Bearer {settings.METRICS_TOKEN}'
+            )
+        return request.user.is_active and request.user.is_staff
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class ItemExportView(StreamingExportMixin, View):
+    """Потоковая выгрузка всех товаров (?format=ndjson|csv)."""
+
+    export_queryset = Item.objects.order_by('id')
+    export_fields = ('id', 'name', 'description', 'price', 'currency')
+    export_filename = 'items'
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class OrderExportView(StreamingExportMixin, View):
+    """Потоковая выгрузка заказов с сохраненными суммами в центах."""
+
+    export_queryset = Order.objects.order_by('created_at')
+    export_fields = (
+        'id', 'created_at', 'currency', 'discount_id', 'tax_id',
+        'payment_intent_id', 'subtotal_amount', 'tax_amount',
+        'discount_amount', 'total_amount',
+    )
+    export_filename = 'orders'
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class StripeWebhookView(View):
+    """Принимает вебхуки Stripe.
+
+    Проверяет подпись, сохраняет событие и сразу отвечает 200. Заказы
+    обновляет фоновая команда process_stripe_events.
+    """
+
+    def post(self, request):
+        payload = request.body
+        if not self.verify_signature(
+            payload, request.headers.get('Stripe-Signature', '')
+        ):
+            return JsonResponse({'error': 'Неверная подпись'}, status=400)
+        event = json.loads(payload)
+        # Повторная доставка того же события отбрасывается по event_id.
+        StripeEvent.objects.bulk_create([
+            StripeEvent(
+                event_id=event['id'],
+                event_type=event['type'],
+                payload=event,
+                stripe_created=datetime.fromtimestamp(
+                    event['created'], tz=timezone.utc),
+            )
+        ], ignore_conflicts=True)
+        return HttpResponse(status=status.HTTP_200_OK)
+
+    def verify_signature(self, payload, signature):
+        """Проверяет подпись секретом вебхука любого из аккаунтов."""
+        for secret in get_registry().webhook_secrets:
+            try:
+                stripe.WebhookSignature.verify_header(
+                    payload.decode(), signature, secret)
+                return True
+            except (stripe.error.SignatureVerificationError, ValueError):
+                continue
+        return False
+
+
+class StaticPageView(ConditionalGetMixin, View):
+    """Страница без данных: кэшируется браузерами и CDN без срока."""
+
+    template_name = None
+
+    def get(self, request):
+        with measure('render'):
+            response = render(request, self.template_name)
+        etag = self.build_etag(response.content.decode())
+        response = (
+            self.get_not_modified_response(request, etag) or response)
+        self.set_conditional_headers(response, etag)
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.STATIC_PAGE_MAX_AGE,
+            immutable=True
+        )
+        return response
+
+
+class SuccessView(StaticPageView):
+    """Возрващает страницу успешной оплаты."""
+
+    template_name = 'items/success.html'
+
+
+class CancelView(StaticPageView):
+    """Возрващает страницу отмены оплаты."""
+
+    template_name = 'items/cancel.html'
@@ -0,0 +1,83 @@
+"""Нагрузочный бенчмарк оплаты заказа: синхронный WSGI против ASGI.
+
+Поднимает заглушку Stripe с задержкой ответа и по очереди запускает
+приложение под uvicorn:
+
+* sync  — payments.wsgi (интерфейс WSGI, uvicorn выполняет приложение
+  в пуле из 10 потоков), представление /order/<id>/checkout/;
+* async — payments.asgi, представление /async/order/<id>/checkout/.
+
+    cd payments && python -m benchmarks.checkout_load --latency 300
+"""
+import argparse
+import os
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+from benchmarks.fake_stripe import start_fake_stripe  # noqa: E402
+from benchmarks.common import free_port, load, start_server  # noqa: E402
+
+
+def seed_order():
+    """Создает схему БД и тестовый заказ, возвращает его id."""
+    django.setup()
+    from django.core.management import call_command
+
+    from core.models import Item, Order, OrderItem
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    items = Item.objects.bulk_create(
+        Item(name=f'Товар {i}', description='Бенчмарк', price=10 + i)
+        for i in range(5)
+    )
+    order = Order.objects.create()
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, item=item, quantity=2) for item in items)
+    return order.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument(
+        '--latency', type=float, default=300, help='Задержка Stripe, мс')
+    args = parser.parse_args()
+
+    stripe_server = start_fake_stripe(latency=args.latency / 1000)
+    env = {'STRIPE_API_BASE': stripe_server.url}
+    order_id = seed_order()
+    modes = (
+        ('sync', 'payments.wsgi:application', ['--interface', 'wsgi'],
+         f'/order/{order_id}/checkout/'),
+        ('async', 'payments.asgi:application', [],
+         f'/async/order/{order_id}/checkout/'),
+    )
+    for name, app, options, path in modes:
+        port = free_port()
+        server = start_server(
+            ['uvicorn', app, '--port', str(port), '--no-access-log',
+             *options],
+            port,
+            env=env,
+        )
+        try:
+            result = load(
+                'GET', f'http://127.0.0.1:{port}{path}',
+                args.requests, args.concurrency
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        print(
+            f'{name:>5}: {result["rps"]:8.1f} req/s  '
+            f'p50 {result["p50_ms"]:8.1f} мс  p95 {result["p95_ms"]:8.1f} мс  '
+            f'p99 {result["p99_ms"]:8.1f} мс  ошибок {result["errors"]}'
+        )
+    stripe_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Общие помощники бенчмарков: запуск сервера, нагрузка, статистика."""
+import os
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+# Число запросов к БД из заголовка Server-Timing (api/middleware.py).
+DB_QUERIES_RE = re.compile(r'\bdb;[^,]*desc="(\d+) queries"')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f'Сервер не поднялся на порту {port}')
+
+
+def start_server(args, port, env=None):
+    """Запускает сервер приложения отдельным процессом."""
+    process = subprocess.Popen(
+        [sys.executable, '-m', *args],
+        cwd=PROJECT_DIR,
+        env={
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': 'benchmarks.settings',
+            **(env or {}),
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0, queries=None):
+    """Сводка замера: пропускная способность и перцентили в мс."""
+    summary = {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+    if queries:
+        summary['queries_per_request'] = round(
+            sum(queries) / len(queries), 2)
+        summary['max_queries'] = max(queries)
+    return summary
+
+
+def get_db_queries(response):
+    """Число запросов к БД из Server-Timing или None без заголовка."""
+    header = response.headers.get('Server-Timing')
+    if header is None:
+        return None
+    match = DB_QUERIES_RE.search(header)
+    return int(match.group(1)) if match else 0
+
+
+def load(method, url, total, concurrency, timeout=60, json=None):
+    """Отправляет total запросов с заданной параллельностью.
+
+    url и json — адрес и тело запроса; вызываемый объект получает
+    номер запроса.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    lock = threading.Lock()
+    latencies = []
+    queries = []
+    errors = 0
+
+    def one(index):
+        nonlocal errors
+        started = time.perf_counter()
+        db_queries = None
+        try:
+            response = session.request(
+                method, url(index) if callable(url) else url,
+                timeout=timeout,
+                json=json(index) if callable(json) else json,
+            )
+            failed = response.status_code >= 400
+            db_queries = get_db_queries(response)
+        except requests.RequestException:
+            failed = True
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            errors += failed
+            if db_queries is not None:
+                queries.append(db_queries)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    session.close()
+    return summarize(latencies, elapsed, errors, queries)
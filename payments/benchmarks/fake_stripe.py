@@ -0,0 +1,134 @@
+"""Локальная заглушка API Stripe для бенчмарков.
+
+Отвечает на создание Checkout Session и Payment Intent, держит
+keep-alive соединения (HTTP/1.1) и считает открытые соединения и
+запросы. Запуск отдельным процессом:
+
+    python -m benchmarks.fake_stripe --port 12111 --latency 300
+
+и STRIPE_API_BASE=http://127.0.0.1:12111 в окружении приложения.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+OBJECTS = {
+    '/v1/checkout/sessions': ('cs_test', 'checkout.session', 'open'),
+    '/v1/payment_intents': (
+        'pi_test', 'payment_intent', 'requires_payment_method'),
+}
+
+
+class FakeStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными write(): без TCP_NODELAY
+    # keep-alive соединения ловят задержку Nagle/delayed ACK.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = dict(parse_qsl(self.rfile.read(length).decode()))
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.path not in OBJECTS:
+            self.send_json(404, {'error': {
+                'type': 'invalid_request_error',
+                'message': f'Unrecognized request URL (POST: {self.path})',
+            }})
+            return
+        idempotency_key = self.headers.get('Idempotency-Key')
+        with self.server.lock:
+            payload = self.server.idempotent.get(idempotency_key)
+        if payload is None:
+            prefix, object_name, status = OBJECTS[self.path]
+            object_id = f'{prefix}_{uuid.uuid4().hex[:24]}'
+            payload = {
+                'id': object_id,
+                'object': object_name,
+                'client_secret': f'{object_id}_secret_{uuid.uuid4().hex}',
+                'url': f'https://checkout.stripe.test/{object_id}',
+                'amount': int(params.get('amount', 0)),
+                'currency': params.get('currency', 'usd'),
+                'status': status,
+            }
+            with self.server.lock:
+                self.server.objects[object_id] = payload
+                if idempotency_key:
+                    self.server.idempotent[idempotency_key] = payload
+        self.send_json(200, payload)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            payload = self.server.objects.get(self.path.rsplit('/', 1)[-1])
+        if payload is None:
+            self.send_json(404, {'error': {
+                'type': 'invalid_request_error',
+                'message': f'No such object: {self.path}',
+            }})
+            return
+        self.send_json(200, payload)
+
+
+class FakeStripeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0):
+        super().__init__(address, FakeStripeHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.idempotent = {}
+        self.objects = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_fake_stripe(port=0, latency=0.0):
+    """Запускает заглушку в фоновом потоке и возвращает сервер."""
+    server = FakeStripeServer(('127.0.0.1', port), latency=latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument(
+        '--latency', type=float, default=0, help='Задержка ответа, мс')
+    args = parser.parse_args()
+    server = FakeStripeServer(
+        ('127.0.0.1', args.port), latency=args.latency / 1000)
+    print(f'Fake Stripe API: {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
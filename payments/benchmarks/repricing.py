@@ -0,0 +1,141 @@
+"""Бенчмарк массового пересчета сумм заказов.
+
+Сравнивает три способа посчитать итоги для многих заказов:
+
+* decimal — прежний расчет в Decimal (цена * количество, ставки / 100);
+* cents   — core.pricing.calculate_totals() в целых центах;
+* sql     — аннотации Order.objects.with_totals() в БД.
+
+    cd payments && python -m benchmarks.repricing --orders 1000000
+"""
+import argparse
+import os
+import random
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+SAMPLE_SIZE = 10000
+
+
+def make_sample(seed=1):
+    """Набор разных заказов: [(позиции, налог %, скидка %), ...]."""
+    rng = random.Random(seed)
+    sample = []
+    for _ in range(SAMPLE_SIZE):
+        lines = [
+            (Decimal(rng.randint(1, 99999)) / 100, rng.randint(1, 10))
+            for _ in range(rng.randint(1, 5))
+        ]
+        tax = Decimal(rng.randint(0, 2500)) / 100 if rng.random() < .7 else 0
+        discount = (
+            Decimal(rng.randint(0, 5000)) / 100 if rng.random() < .3 else 0)
+        sample.append((lines, tax, discount))
+    return sample
+
+
+def decimal_totals(lines, tax, discount):
+    total = sum(price * quantity for price, quantity in lines)
+    total += total * tax / 100
+    total -= total * discount / 100
+    return total.quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+def run_python(orders, sample):
+    from core.pricing import calculate_totals, to_basis_points, to_cents
+
+    cents_sample = [
+        (
+            [(to_cents(price), quantity) for price, quantity in lines],
+            to_basis_points(tax),
+            to_basis_points(discount),
+        )
+        for lines, tax, discount in sample
+    ]
+    results = {}
+    for name, function, data in (
+        ('decimal', decimal_totals, sample),
+        ('cents', calculate_totals, cents_sample),
+    ):
+        started = time.perf_counter()
+        for index in range(orders):
+            function(*data[index % SAMPLE_SIZE])
+        results[name] = time.perf_counter() - started
+    return results
+
+
+def run_sql(orders, sample):
+    from django.core.management import call_command
+
+    from core.models import Discount, Item, Order, OrderItem, Tax
+
+    call_command('migrate', verbosity=0)
+    OrderItem.objects.all().delete()
+    Order.objects.all().delete()
+    taxes = {}
+    discounts = {}
+    for lines, tax, discount in sample:
+        if tax and tax not in taxes:
+            taxes[tax] = Tax.objects.create(name=f'{tax}%', rate=tax)
+        if discount and discount not in discounts:
+            discounts[discount] = Discount.objects.create(
+                name=f'{discount}%', percent_off=discount)
+    prices = sorted({price for lines, _, _ in sample for price, _ in lines})
+    items = dict(zip(prices, Item.objects.bulk_create(
+        Item(name=str(price), description='Бенчмарк', price=price)
+        for price in prices
+    )))
+    for start in range(0, orders, SAMPLE_SIZE):
+        chunk = [
+            sample[index % SAMPLE_SIZE]
+            for index in range(start, min(orders, start + SAMPLE_SIZE))
+        ]
+        created = Order.objects.bulk_create(
+            Order(tax=taxes.get(tax), discount=discounts.get(discount))
+            for _, tax, discount in chunk
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, item=items[price], quantity=quantity)
+            for order, (lines, _, _) in zip(created, chunk)
+            # В заказе товар встречается один раз.
+            for price, quantity in dict(lines).items()
+        )
+    started = time.perf_counter()
+    count = sum(
+        1 for _ in Order.objects.with_totals()
+        .values_list('total_cents', flat=True)
+        .iterator(chunk_size=SAMPLE_SIZE)
+    )
+    return count, time.perf_counter() - started
+
+
+def report(name, orders, elapsed):
+    print(
+        f'{name:>8}: {orders} заказов за {elapsed:6.2f} с, '
+        f'{orders / elapsed:12.0f} заказов/с'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument(
+        '--db-orders', type=int, default=100000,
+        help='Заказов в БД для пересчета через SQL (0 — пропустить)'
+    )
+    args = parser.parse_args()
+    django.setup()
+
+    sample = make_sample()
+    for name, elapsed in run_python(args.orders, sample).items():
+        report(name, args.orders, elapsed)
+    if args.db_orders:
+        count, elapsed = run_sql(args.db_orders, sample)
+        report('sql', count, elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Процессорное время на строку: сериализаторы DRF против .values().
+
+Заполняет БД (как benchmarks.suite) и в одном процессе, без HTTP,
+сравнивает два пути чтения для списка товаров и заказов с наибольшим
+числом позиций:
+
+* drf    — модели, ItemSerializer/OrderSerializer и JSONRenderer
+           (как ItemListView и OrderDetailView до api.read_serializers);
+* values — строки .values(), api.read_serializers и FastJSONRenderer.
+
+Для каждого пути печатается время процессора на строку (товар или
+позицию заказа) отдельно для сериализации с рендерингом и вместе с
+запросами к БД. Перед замером проверяется, что оба пути дают один и
+тот же JSON байт в байт.
+
+    cd payments && python -m benchmarks.serializers --page-size 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+from benchmarks.suite import seed  # noqa: E402
+
+
+def measure_cpu(function, rows, repeat):
+    """Время процессора на строку в микросекундах (лучший из repeat)."""
+    best = None
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / rows * 1e6
+
+
+def get_item_paths(page_size):
+    from api.read_serializers import get_item_values, serialize_items
+    from api.renderers import FastJSONRenderer, MeasuredJSONRenderer
+    from api.serializers import ItemSerializer
+    from core.models import Item
+
+    items = Item.objects.order_by('id')[:page_size]
+    rows = items.values(*get_item_values())
+    drf_renderer = MeasuredJSONRenderer()
+    fast_renderer = FastJSONRenderer()
+    instances = list(items)
+    values = list(rows)
+    return len(values), {
+        'drf': (
+            lambda: drf_renderer.render(
+                ItemSerializer(instances, many=True).data),
+            lambda: drf_renderer.render(
+                ItemSerializer(list(items.all()), many=True).data),
+        ),
+        'values': (
+            lambda: fast_renderer.render(serialize_items(values)),
+            lambda: fast_renderer.render(serialize_items(list(rows.all()))),
+        ),
+    }
+
+
+def get_order_paths(order_id):
+    from api.read_serializers import (
+        get_order_items, get_order_row, serialize_order)
+    from api.renderers import FastJSONRenderer, MeasuredJSONRenderer
+    from api.serializers import OrderSerializer
+    from core.models import Order
+
+    def load_order():
+        return Order.objects.with_related().with_totals().get(id=order_id)
+
+    drf_renderer = MeasuredJSONRenderer()
+    fast_renderer = FastJSONRenderer()
+    order = load_order()
+    row = get_order_row(order_id)
+    items = get_order_items(order_id)
+    return len(items), {
+        'drf': (
+            lambda: drf_renderer.render(OrderSerializer(order).data),
+            lambda: drf_renderer.render(OrderSerializer(load_order()).data),
+        ),
+        'values': (
+            lambda: fast_renderer.render(serialize_order(row, items)),
+            lambda: fast_renderer.render(serialize_order(
+                get_order_row(order_id), get_order_items(order_id))),
+        ),
+    }
+
+
+def report(name, rows, paths, repeat):
+    drf_serialize, _ = paths['drf']
+    values_serialize, _ = paths['values']
+    if drf_serialize() != values_serialize():
+        raise SystemExit(f'{name}: ответы drf и values различаются')
+    results = {
+        path: [measure_cpu(function, rows, repeat) for function in functions]
+        for path, functions in paths.items()
+    }
+    for path, (serialize, total) in results.items():
+        print(
+            f'{name:>12} {path:>6}: {serialize:7.2f} мкс/строку '
+            f'сериализация, {total:7.2f} мкс/строку с запросами'
+        )
+    print(
+        f'{name:>12} ускорение: '
+        f'x{results["drf"][0] / results["values"][0]:.1f} сериализация, '
+        f'x{results["drf"][1] / results["values"][1]:.1f} с запросами'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--database-url',
+        default='sqlite:///' + os.path.join(
+            tempfile.gettempdir(), 'bench-serializers.sqlite3'))
+    args = parser.parse_args()
+    os.environ['BENCH_DATABASE_URL'] = args.database_url
+
+    seed(args)
+    from django.db.models import Count
+
+    from core.models import Order
+
+    rows, paths = get_item_paths(args.page_size)
+    report('item-list', rows, paths, args.repeat)
+    order_id = Order.objects.annotate(
+        lines=Count('order_items')).order_by('-lines').values_list(
+            'id', flat=True).first()
+    rows, paths = get_order_paths(order_id)
+    report(f'order x{rows}', rows, paths, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
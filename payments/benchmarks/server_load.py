@@ -0,0 +1,113 @@
+"""Пропускная способность на ядро: runserver против gunicorn.
+
+Заполняет БД (как benchmarks.suite), собирает статику и по очереди
+запускает приложение:
+
+* runserver — manage.py runserver (один процесс, поток на запрос);
+* wsgi      — gunicorn -c gunicorn.conf.py, WEB_SERVER=wsgi (gthread);
+* asgi      — gunicorn -c gunicorn.conf.py, WEB_SERVER=asgi (uvicorn).
+
+Для каждого сервера и числа процессов из --workers нагружает список
+товаров, заказ и файл статики и печатает запросы в секунду в целом и
+на ядро (делится на число занятых ядер: min(процессов, ядер машины)).
+
+    cd payments && python -m benchmarks.server_load --workers 1 --workers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+from benchmarks.common import free_port, load, start_server  # noqa: E402
+from benchmarks.suite import seed  # noqa: E402
+
+SERVERS = ('runserver', 'wsgi', 'asgi')
+
+
+def prepare(args):
+    """Данные в БД и собранная статика; возвращает адреса сценариев."""
+    data = seed(argparse.Namespace(
+        items=args.items, orders=args.orders, seed=1))
+    from django.conf import settings
+    from django.core.management import call_command
+
+    call_command('collectstatic', interactive=False, verbosity=0)
+    with open(os.path.join(settings.STATIC_ROOT, 'staticfiles.json')) as file:
+        css = json.load(file)['paths']['css/item_detail.css']
+    return {
+        'item-list': '/api/items/',
+        'order-detail': f'/api/orders/{data["orders"][0]}/',
+        'static': settings.STATIC_URL + css,
+    }
+
+
+def get_server_command(name, port, workers, threads):
+    if name == 'runserver':
+        return (
+            ['django', 'runserver', f'127.0.0.1:{port}', '--noreload'], {})
+    return (
+        ['gunicorn', '-c', 'gunicorn.conf.py'],
+        {
+            'WEB_SERVER': name,
+            'WEB_BIND': f'127.0.0.1:{port}',
+            'WEB_WORKERS': str(workers),
+            'WEB_THREADS': str(threads),
+        },
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument(
+        '--server', action='append', choices=SERVERS,
+        help='Сервер для замера (по умолчанию все)')
+    parser.add_argument(
+        '--workers', type=int, action='append',
+        help='Число процессов gunicorn (можно несколько раз)')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=100)
+    parser.add_argument(
+        '--database-url',
+        default='sqlite:///' + os.path.join(
+            tempfile.gettempdir(), 'bench-server.sqlite3'))
+    args = parser.parse_args()
+    os.environ['BENCH_DATABASE_URL'] = args.database_url
+
+    paths = prepare(args)
+    cpu_count = os.cpu_count() or 1
+    print(f'Ядер: {cpu_count}')
+    for name in args.server or SERVERS:
+        # У runserver один процесс, число воркеров к нему не относится.
+        for workers in [1] if name == 'runserver' else args.workers or [1]:
+            port = free_port()
+            command, env = get_server_command(
+                name, port, workers, args.threads)
+            server = start_server(command, port, env=env)
+            cores = min(workers, cpu_count)
+            try:
+                for scenario, path in paths.items():
+                    url = f'http://127.0.0.1:{port}{path}'
+                    load('GET', url, args.concurrency, args.concurrency)
+                    result = load(
+                        'GET', url, args.requests, args.concurrency)
+                    print(
+                        f'{name:>9} x{workers:<2} {scenario:>12}: '
+                        f'{result["rps"]:8.1f} req/s  '
+                        f'{result["rps"] / cores:8.1f} req/s на ядро  '
+                        f'p50 {result["p50_ms"]:7.1f} мс  '
+                        f'p99 {result["p99_ms"]:7.1f} мс  '
+                        f'ошибок {result["errors"]}'
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""Настройки Django для бенчмарков.
+
+Отдельная БД (BENCH_DATABASE_URL, по умолчанию SQLite-файл BENCH_DB) и
+заглушка Stripe (STRIPE_API_BASE), чтобы замеры не трогали рабочую базу
+и настоящий Stripe.
+"""
+import os
+import tempfile
+
+from payments.database import parse_database_url
+from payments.settings import *  # noqa: F401,F403
+from payments.settings import BASE_DIR
+
+SECRET_KEY = 'benchmark'
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+DOMAIN = 'http://127.0.0.1:8000'
+# Число запросов к БД берется из Server-Timing: без DEBUG он выключен.
+SERVER_TIMING_ENABLED = True
+
+DATABASES = {
+    'default': parse_database_url(
+        os.getenv(
+            'BENCH_DATABASE_URL',
+            'sqlite:///' + os.getenv(
+                'BENCH_DB',
+                os.path.join(tempfile.gettempdir(), 'bench.sqlite3')),
+        ),
+        BASE_DIR,
+        conn_max_age=60,
+        health_checks=True,
+    )
+}
+
+STRIPE_PUBLISHABLE_KEY = STRIPE_PUBLISHABLE_KEY_EUR = 'pk_test_benchmark'
+STRIPE_SECRET_KEY = STRIPE_SECRET_KEY_EUR = 'sk_test_benchmark'
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'http://127.0.0.1:12111')
+STRIPE_MAX_NETWORK_RETRIES = 0
+# Замеры пропускной способности не должны упираться в лимит частоты.
+STRIPE_RATE_LIMIT = float(os.getenv('STRIPE_RATE_LIMIT', '0'))
+# Статика бенчмарков собирается во временный каталог.
+STATIC_ROOT = os.path.join(tempfile.gettempdir(), 'bench-static')
@@ -0,0 +1,86 @@
+"""Бенчмарк пула соединений Stripe-клиентов на локальной заглушке.
+
+Сравнивает общий клиент из api.stripe_clients с клиентом, который
+создается заново на каждый вызов (новое соединение на запрос).
+
+    cd payments && python -m benchmarks.stripe_pool --threads 8 --calls 200
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+django.setup()
+
+import requests  # noqa: E402
+import stripe  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from api.stripe_clients import (  # noqa: E402
+    get_stripe_client,
+    reset_stripe_clients,
+)
+from benchmarks.fake_stripe import start_fake_stripe  # noqa: E402
+
+SECRET_KEY = 'sk_test_benchmark'
+PARAMS = {'amount': 1000, 'currency': 'usd'}
+
+
+def pooled_call():
+    get_stripe_client(SECRET_KEY).v1.payment_intents.create(PARAMS)
+
+
+def unpooled_call(api_base):
+    session = requests.Session()
+    client = stripe.StripeClient(
+        SECRET_KEY,
+        base_addresses={'api': api_base},
+        http_client=stripe.RequestsClient(session=session),
+    )
+    client.v1.payment_intents.create(PARAMS)
+    session.close()
+
+
+def run(name, server, call, threads, calls):
+    connections, requests_before = server.connections, server.requests
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(call) for _ in range(calls)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+    print(
+        f'{name:>10}: {calls / elapsed:8.1f} req/s, '
+        f'{server.connections - connections} соединений на '
+        f'{server.requests - requests_before} запросов'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument(
+        '--latency', type=float, default=0, help='Задержка заглушки, мс')
+    args = parser.parse_args()
+
+    server = start_fake_stripe(latency=args.latency / 1000)
+    # Клиент без пула идет мимо ограничителя частоты, поэтому и у
+    # общего клиента лимит выключен.
+    with override_settings(
+        STRIPE_API_BASE=server.url, STRIPE_HTTP_POOL_SIZE=args.threads,
+        STRIPE_RATE_LIMIT=0
+    ):
+        reset_stripe_clients()
+        run('pooled', server, pooled_call, args.threads, args.calls)
+        run(
+            'unpooled', server, lambda: unpooled_call(server.url),
+            args.threads, args.calls
+        )
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
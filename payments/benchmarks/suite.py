@@ -0,0 +1,325 @@
+"""Набор бенчмарков основных эндпоинтов с сохранением базовой линии.
+
+Заполняет отдельную БД воспроизводимыми данными (каталог товаров в USD
+и EUR, налоги, скидки, заказы от 1 до 500 позиций), поднимает заглушку
+Stripe и приложение под uvicorn (WSGI) и по очереди нагружает:
+
+* item-list            — GET  /api/items/
+* order-detail         — GET  /api/orders/<id>/
+* order-create         — POST /api/orders/
+* item-checkout        — GET  /buy/<id>/
+* item-payment-intent  — GET  /payment-intent/<id>/
+* order-checkout       — GET  /order/<id>/checkout/
+* order-payment-intent — POST /order/<id>/payment-intent/
+
+Для каждого сценария печатаются запросы в секунду, перцентили задержки
+и запросы к БД на запрос (из заголовка Server-Timing). Результаты
+сохраняются в JSON и сравниваются с прошлым прогоном:
+
+    cd payments && python -m benchmarks.suite --save baseline.json
+    cd payments && python -m benchmarks.suite --compare baseline.json
+
+С --compare команда завершается с кодом 1, если какой-то сценарий стал
+медленнее больше чем на --threshold процентов или делает больше
+запросов к БД.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import django
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+from benchmarks.common import free_port, load, start_server  # noqa: E402
+from benchmarks.fake_stripe import start_fake_stripe  # noqa: E402
+
+SCENARIOS = (
+    'item-list',
+    'order-detail',
+    'order-create',
+    'item-checkout',
+    'item-payment-intent',
+    'order-checkout',
+    'order-payment-intent',
+)
+# Показатель и направление: 1 — больше лучше, -1 — меньше лучше.
+COMPARED_METRICS = (
+    ('rps', 1),
+    ('p50_ms', -1),
+    ('p95_ms', -1),
+    ('p99_ms', -1),
+)
+
+
+def get_order_size(rng):
+    """Позиций в заказе: в основном немного, изредка до 500."""
+    roll = rng.random()
+    if roll < .7:
+        return rng.randint(1, 5)
+    if roll < .95:
+        return rng.randint(6, 50)
+    return rng.randint(51, 500)
+
+
+def seed(args):
+    """Заполняет БД и возвращает id товаров, заказов и справочников."""
+    django.setup()
+    from django.core.management import call_command
+
+    from core.models import (
+        Currency, Discount, Item, Order, OrderItem, StripeJob, Tax)
+
+    rng = random.Random(args.seed)
+    call_command('migrate', verbosity=0)
+    for model in (OrderItem, Order, StripeJob, Item, Tax, Discount):
+        model.objects.all().delete()
+
+    taxes = Tax.objects.bulk_create(
+        Tax(name=f'Налог {rate}%', rate=rate)
+        for rate in (Decimal('5'), Decimal('8.25'), Decimal('13'),
+                     Decimal('20'))
+    )
+    discounts = Discount.objects.bulk_create(
+        Discount(name=f'Скидка {percent}%', percent_off=percent)
+        for percent in (Decimal('5'), Decimal('10'), Decimal('15.5'))
+    )
+    items = Item.objects.bulk_create(
+        (
+            Item(
+                name=f'Товар {index}',
+                description='Бенчмарк',
+                price=Decimal(rng.randint(100, 500000)) / 100,
+                currency=(
+                    Currency.EUR if rng.random() < .2 else Currency.USD),
+            )
+            for index in range(args.items)
+        ),
+        batch_size=5000,
+    )
+    catalog = {}
+    for item in items:
+        catalog.setdefault(item.currency, []).append(item.pk)
+
+    orders = []
+    order_items = []
+    for _ in range(args.orders):
+        currency = rng.choice(list(catalog))
+        order = Order(
+            currency=currency,
+            tax=rng.choice(taxes) if rng.random() < .7 else None,
+            discount=rng.choice(discounts) if rng.random() < .3 else None,
+        )
+        orders.append(order)
+        item_ids = rng.sample(
+            catalog[currency],
+            min(get_order_size(rng), len(catalog[currency]))
+        )
+        order_items.extend(
+            OrderItem(order=order, item_id=item_id,
+                      quantity=rng.randint(1, 10))
+            for item_id in item_ids
+        )
+    Order.objects.bulk_create(orders, batch_size=5000)
+    OrderItem.objects.bulk_create(order_items, batch_size=5000)
+    Order.objects.recalculate_totals()
+    return {
+        'catalog': catalog,
+        'orders': [str(order.pk) for order in orders],
+        'taxes': [tax.pk for tax in taxes],
+        'discounts': [discount.pk for discount in discounts],
+        'lines': len(order_items),
+    }
+
+
+def build_scenarios(data, seed):
+    """Метод, адрес и тело запроса по номеру запроса для сценариев."""
+    rng = random.Random(seed)
+    currencies = sorted(data['catalog'])
+    items = [
+        pk for currency in currencies for pk in data['catalog'][currency]]
+    orders = data['orders']
+    payloads = []
+    for _ in range(1000):
+        catalog = data['catalog'][rng.choice(currencies)]
+        payload = {'items': [
+            {'item_id': item_id, 'quantity': rng.randint(1, 10)}
+            for item_id in rng.sample(
+                catalog, min(get_order_size(rng), len(catalog)))
+        ]}
+        if rng.random() < .7:
+            payload['tax'] = rng.choice(data['taxes'])
+        if rng.random() < .3:
+            payload['discount'] = rng.choice(data['discounts'])
+        payloads.append(payload)
+
+    def item(index):
+        return items[index * 7919 % len(items)]
+
+    def order(index):
+        return orders[index * 7919 % len(orders)]
+
+    def item_list(index):
+        if index % 2:
+            currency = currencies[index % len(currencies)]
+            return f'/api/items/?currency={currency}'
+        return '/api/items/'
+
+    return {
+        'item-list': ('GET', item_list, None),
+        'order-detail': (
+            'GET', lambda index: f'/api/orders/{order(index)}/', None),
+        'order-create': (
+            'POST', '/api/orders/',
+            lambda index: payloads[index % len(payloads)]),
+        'item-checkout': (
+            'GET', lambda index: f'/buy/{item(index)}/', None),
+        'item-payment-intent': (
+            'GET', lambda index: f'/payment-intent/{item(index)}/', None),
+        'order-checkout': (
+            'GET', lambda index: f'/order/{order(index)}/checkout/', None),
+        'order-payment-intent': (
+            'POST', lambda index: f'/order/{order(index)}/payment-intent/',
+            None),
+    }
+
+
+def run(args):
+    data = seed(args)
+    print(
+        f'Данные: {args.items} товаров, {len(data["orders"])} заказов, '
+        f'{data["lines"]} позиций'
+    )
+    scenarios = build_scenarios(data, args.seed)
+    stripe_server = start_fake_stripe(latency=args.stripe_latency / 1000)
+    port = free_port()
+    server = start_server(
+        ['uvicorn', 'payments.wsgi:application', '--interface', 'wsgi',
+         '--port', str(port), '--no-access-log'],
+        port,
+        env={'STRIPE_API_BASE': stripe_server.url},
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    results = {}
+    try:
+        for name in args.scenario or SCENARIOS:
+            method, path, body = scenarios[name]
+            url = (
+                (lambda index, path=path: base_url + path(index))
+                if callable(path) else base_url + path
+            )
+            # Прогрев: соединения, кэши и ленивые импорты.
+            load(method, url, args.warmup, args.concurrency, json=body)
+            results[name] = load(
+                method, url, args.requests, args.concurrency, json=body)
+            report(name, results[name])
+    finally:
+        server.terminate()
+        server.wait()
+        stripe_server.shutdown()
+    return {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': args.database_url.split(':', 1)[0],
+            'items': args.items,
+            'orders': args.orders,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'stripe_latency_ms': args.stripe_latency,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+
+
+def report(name, result):
+    print(
+        f'{name:>21}: {result["rps"]:8.1f} req/s  '
+        f'p50 {result["p50_ms"]:8.1f} мс  p95 {result["p95_ms"]:8.1f} мс  '
+        f'p99 {result["p99_ms"]:8.1f} мс  '
+        f'БД {result.get("queries_per_request", 0):6.1f} запр.  '
+        f'ошибок {result["errors"]}'
+    )
+
+
+def compare(baseline, current, threshold):
+    """Печатает изменения относительно базовой линии, возвращает
+    список регрессий."""
+    regressions = []
+    print(f'\nСравнение с базовой линией от {baseline["meta"]["created_at"]}')
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f'{name:>21}: нет в базовой линии')
+            continue
+        changes = []
+        for metric, direction in COMPARED_METRICS:
+            if not before[metric]:
+                continue
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            changes.append(f'{metric} {change:+6.1f}%')
+            if change * direction < -threshold:
+                regressions.append(f'{name}: {metric} {change:+.1f}%')
+        queries = result.get('queries_per_request', 0)
+        queries_before = before.get('queries_per_request', 0)
+        changes.append(f'БД {queries_before:g} → {queries:g}')
+        if queries > queries_before:
+            regressions.append(
+                f'{name}: запросов к БД {queries_before:g} → {queries:g}')
+        print(f'{name:>21}: ' + '  '.join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument(
+        '--stripe-latency', type=float, default=0,
+        help='Задержка заглушки Stripe, мс')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--scenario', action='append', choices=SCENARIOS,
+        help='Запустить только этот сценарий (можно несколько раз)')
+    parser.add_argument(
+        '--database-url',
+        default='sqlite:///' + os.path.join(
+            tempfile.gettempdir(), 'bench-suite.sqlite3'))
+    parser.add_argument('--save', help='Сохранить результаты в JSON')
+    parser.add_argument('--compare', help='Сравнить с JSON базовой линии')
+    parser.add_argument(
+        '--threshold', type=float, default=10,
+        help='Допустимое ухудшение при сравнении, %%')
+    args = parser.parse_args()
+    # Приложение под uvicorn наследует окружение и ту же БД.
+    os.environ['BENCH_DATABASE_URL'] = args.database_url
+
+    current = run(args)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2, ensure_ascii=False)
+        print(f'Результаты сохранены в {args.save}')
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print('\nРегрессии:\n  ' + '\n  '.join(regressions))
+            sys.exit(1)
+        print('\nРегрессий нет')
+
+
+if __name__ == '__main__':
+    main()
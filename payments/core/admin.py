@@ -1,11 +1,23 @@
+from django import forms
 from django.contrib import admin
 
-from .models import Discount, Item, Order, OrderItem, Tax
+from .models import (
+    Discount,
+    Item,
+    Order,
+    OrderItem,
+    StripeEvent,
+    StripeJob,
+    Tax,
+)
+from .pricing import from_cents
+from .stripe_accounts import get_currency_choices
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
+    autocomplete_fields = ('item',)
 
 
 @admin.register(Item)
@@ -13,6 +25,16 @@ class ItemAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'currency')
     search_fields = ('name',)
 
+    def formfield_for_dbfield(self, db_field, request, **kwargs):
+        # Выбор из валют реестра аккаунтов Stripe на момент открытия формы.
+        if db_field.name == 'currency':
+            return forms.ChoiceField(
+                label=db_field.verbose_name,
+                choices=get_currency_choices(),
+                initial=db_field.default,
+            )
+        return super().formfield_for_dbfield(db_field, request, **kwargs)
+
 
 @admin.register(Discount)
 class DiscountAdmin(admin.ModelAdmin):
@@ -26,14 +48,46 @@ class TaxAdmin(admin.ModelAdmin):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'created_at', 'get_total_price', 'get_currency')
+    list_display = (
+        'id', 'created_at', 'status', 'get_total_price', 'currency')
     inlines = (OrderItemInline,)
-    list_filter = ('created_at',)
+    list_filter = ('status', 'currency', 'created_at')
+    readonly_fields = ('currency',)
+    # Без полного подсчета строк в таблице на каждую страницу.
+    show_full_result_count = False
 
-    @admin.display(description='Общая сумма')
+    @admin.display(description='Общая сумма', ordering='total_amount')
     def get_total_price(self, obj):
-        return f'{obj.get_total_price():.2f}'
+        # Сохраненная сумма: без подзапроса по позициям на каждую строку.
+        return from_cents(obj.total_amount)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Валюта заказа следует за товарами, измененными в инлайне.
+        order = form.instance
+        currency = order.get_items_currency()
+        if order.currency != currency:
+            order.currency = currency
+            order.save(update_fields=['currency'])
+        # Суммы заказа, переданного в Stripe, сверяются с оплатой и не
+        # пересчитываются (как в core.cart.get_pending_order).
+        Order.objects.filter(
+            pk=order.pk, checkout_session_id='', payment_intent_id=''
+        ).recalculate_totals()
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'event_id', 'event_type', 'received_at', 'processed_at', 'error')
+    # Пустой фильтр по ошибке: события, требующие ручного разбора.
+    list_filter = ('event_type', ('error', admin.EmptyFieldListFilter))
+    search_fields = ('event_id',)
+
 
-    @admin.display(description='Валюта')
-    def get_currency(self, obj):
-        return obj.get_currency()
+@admin.register(StripeJob)
+class StripeJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'object_id', 'status', 'attempts', 'created_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('object_id',)
@@ -1,7 +1,28 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
     verbose_name = 'Платежи'
+
+    def ready(self):
+        from payments.database import configure_sqlite
+
+        from .cache import invalidate
+        from .stripe_accounts import get_registry
+
+        connection_created.connect(
+            configure_sqlite, dispatch_uid='core.configure_sqlite')
+        for model_name in ('Item', 'Tax', 'Discount'):
+            model = self.get_model(model_name)
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    invalidate, sender=model,
+                    dispatch_uid=f'core.invalidate.{model_name}'
+                )
+        # Ошибка в конфигурации аккаунтов Stripe видна при старте, а не
+        # на первом платеже.
+        get_registry()
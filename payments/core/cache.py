@@ -0,0 +1,113 @@
+"""Кэш справочных данных: товары, налоги и скидки.
+
+Объекты читаются через кэш (read-through) и удаляются из него сигналами
+post_save/post_delete, которые подключаются в CoreConfig.ready().
+Бэкенд задается алиасом REFERENCE_CACHE_ALIAS в settings.CACHES:
+локально это LocMemCache (LRU с TTL), в продакшене общий Redis.
+
+QuerySet.update() и bulk_update() сигналов не посылают — после них
+нужно вызвать invalidate() вручную.
+"""
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def get_cache_key(model, pk):
+    return f'ref:{model._meta.label_lower}:{pk}'
+
+
+def record(model, hits=0, misses=0):
+    label = model._meta.label_lower
+    with _stats_lock:
+        _stats[f'{label}:hits'] += hits
+        _stats[f'{label}:misses'] += misses
+
+
+def get_stats():
+    """Счетчики попаданий и промахов текущего процесса по моделям."""
+    with _stats_lock:
+        stats = dict(_stats)
+    result = {}
+    for key, value in stats.items():
+        label, kind = key.rsplit(':', 1)
+        result.setdefault(label, {'hits': 0, 'misses': 0})[kind] = value
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_cached(model, pk):
+    """Возвращает объект по pk из кэша или из БД.
+
+    Если объекта нет, пробрасывает model.DoesNotExist.
+    """
+    pk = model._meta.pk.to_python(pk)
+    key = get_cache_key(model, pk)
+    instance = get_cache().get(key)
+    if instance is not None:
+        record(model, hits=1)
+        return instance
+    record(model, misses=1)
+    instance = model.objects.get(pk=pk)
+    get_cache().set(key, instance, settings.REFERENCE_CACHE_TIMEOUT)
+    return instance
+
+
+async def aget_cached(model, pk):
+    """Асинхронный вариант get_cached()."""
+    pk = model._meta.pk.to_python(pk)
+    key = get_cache_key(model, pk)
+    instance = await get_cache().aget(key)
+    if instance is not None:
+        record(model, hits=1)
+        return instance
+    record(model, misses=1)
+    instance = await model.objects.aget(pk=pk)
+    await get_cache().aset(key, instance, settings.REFERENCE_CACHE_TIMEOUT)
+    return instance
+
+
+def get_many_cached(model, pks):
+    """Возвращает {pk: объект}; промахи дочитываются одним запросом.
+
+    Отсутствующих в БД pk в результате нет.
+    """
+    keys = {get_cache_key(model, pk): pk for pk in pks}
+    cached = get_cache().get_many(keys)
+    instances = {keys[key]: instance for key, instance in cached.items()}
+    missing = set(keys.values()) - set(instances)
+    record(model, hits=len(instances), misses=len(missing))
+    if missing:
+        fetched = model.objects.in_bulk(missing)
+        get_cache().set_many(
+            {get_cache_key(model, pk): instance
+             for pk, instance in fetched.items()},
+            settings.REFERENCE_CACHE_TIMEOUT
+        )
+        instances.update(fetched)
+    return instances
+
+
+def invalidate(sender, instance, **kwargs):
+    """Обработчик post_save/post_delete: удаляет объект из кэша.
+
+    Повторное удаление после коммита не дает параллельному запросу
+    оставить в кэше версию, прочитанную до коммита.
+    """
+    key = get_cache_key(sender, instance.pk)
+    get_cache().delete(key)
+    transaction.on_commit(lambda: get_cache().delete(key))
@@ -0,0 +1,155 @@
+"""Изменение позиций заказа на месте (корзина).
+
+Каждая операция — фиксированное число запросов независимо от размера
+заказа: строка заказа блокируется (select_for_update), позиция
+меняется одним UPDATE/INSERT/DELETE, а сохраненные суммы сдвигаются на
+разницу (OrderQuerySet.add_to_totals()). Товары, налоги и скидки
+читаются через кэш справочников.
+
+Разница считается по цене, с которой позиция вошла в суммы
+(OrderItem.unit_amount): старая часть вычитается по ней, новая
+добавляется по текущей цене товара, и она же сохраняется в позицию.
+Поэтому изменение цены товара между правками не сбивает суммы заказа.
+"""
+from django.db import IntegrityError, transaction
+
+from .cache import get_cached
+from .models import Discount, Item, Order, OrderItem, OrderStatus, Tax
+from .pricing import to_basis_points, to_cents
+
+
+class CartError(Exception):
+    """Изменение заказа невозможно (сообщение — для ответа API)."""
+
+
+def get_pending_order(order_id):
+    """Заказ, заблокированный до конца транзакции.
+
+    Изменять можно только pending-заказ, для которого еще не создана
+    Checkout Session или Payment Intent: их сумма зафиксирована в
+    Stripe, и оплата по ним не должна расходиться с заказом.
+    """
+    order = (
+        Order.objects.select_for_update()
+        .only(
+            'id', 'status', 'currency', 'tax_id', 'discount_id',
+            'checkout_session_id', 'payment_intent_id'
+        )
+        .get(pk=order_id)
+    )
+    if order.status != OrderStatus.PENDING:
+        raise CartError('Изменять можно только неоплаченный заказ.')
+    if order.checkout_session_id or order.payment_intent_id:
+        raise CartError(
+            'Заказ уже передан на оплату; создайте новый заказ.')
+    return order
+
+
+def get_item(item_id):
+    try:
+        return get_cached(Item, item_id)
+    except Item.DoesNotExist:
+        raise CartError(f'Товар не найден: {item_id}')
+
+
+def get_rates(order):
+    """Ставки налога и скидки заказа в базисных пунктах."""
+    tax = order.tax_id and get_cached(Tax, order.tax_id)
+    discount = order.discount_id and get_cached(Discount, order.discount_id)
+    return (
+        to_basis_points(tax.rate) if tax else 0,
+        to_basis_points(discount.percent_off) if discount else 0,
+    )
+
+
+def get_currency_change(order, item):
+    """Поля для UPDATE заказа, если товар меняет его валюту.
+
+    Валюта меняется только у пустого заказа.
+    """
+    if item.currency == order.currency:
+        return {}
+    if order.order_items.exists():
+        raise CartError('Все товары заказа должны быть в одной валюте.')
+    return {'currency': item.currency}
+
+
+def get_line(order, item):
+    """Количество и цена за единицу (центы) позиции или None."""
+    return OrderItem.objects.filter(
+        order_id=order.pk, item_id=item.pk
+    ).values_list('quantity', 'unit_amount').first()
+
+
+def get_existing_line(order, item):
+    line = get_line(order, item)
+    if line is None:
+        raise CartError(f'Товара {item.pk} нет в заказе.')
+    return line
+
+
+def update_totals(order, subtotal_delta, **fields):
+    """Сдвигает суммы заказа и возвращает их после изменения."""
+    Order.objects.filter(pk=order.pk).add_to_totals(
+        subtotal_delta, *get_rates(order), **fields)
+    return Order.objects.values(
+        'currency', 'subtotal_amount', 'tax_amount', 'discount_amount',
+        'total_amount'
+    ).get(pk=order.pk)
+
+
+def add_item(order_id, item_id, quantity):
+    """Добавляет quantity штук товара (новой позицией или к старой)."""
+    item = get_item(item_id)
+    unit_amount = to_cents(item.price)
+    with transaction.atomic():
+        order = get_pending_order(order_id)
+        fields = {}
+        line = get_line(order, item)
+        if line:
+            old_quantity, old_unit_amount = line
+            quantity += old_quantity
+            OrderItem.objects.filter(
+                order_id=order.pk, item_id=item.pk
+            ).update(quantity=quantity, unit_amount=unit_amount)
+            delta = (
+                unit_amount * quantity - old_unit_amount * old_quantity)
+        else:
+            fields = get_currency_change(order, item)
+            try:
+                with transaction.atomic():
+                    OrderItem.objects.create(
+                        order_id=order.pk, item_id=item.pk,
+                        quantity=quantity, unit_amount=unit_amount)
+            except IntegrityError:
+                raise CartError('Товар уже добавлен в заказ.')
+            delta = unit_amount * quantity
+        totals = update_totals(order, delta, **fields)
+    return quantity, totals
+
+
+def set_item_quantity(order_id, item_id, quantity):
+    """Задает количество товара в заказе."""
+    item = get_item(item_id)
+    unit_amount = to_cents(item.price)
+    with transaction.atomic():
+        order = get_pending_order(order_id)
+        old_quantity, old_unit_amount = get_existing_line(order, item)
+        OrderItem.objects.filter(
+            order_id=order.pk, item_id=item.pk
+        ).update(quantity=quantity, unit_amount=unit_amount)
+        totals = update_totals(
+            order, unit_amount * quantity - old_unit_amount * old_quantity)
+    return quantity, totals
+
+
+def remove_item(order_id, item_id):
+    """Удаляет товар из заказа."""
+    item = get_item(item_id)
+    with transaction.atomic():
+        order = get_pending_order(order_id)
+        old_quantity, old_unit_amount = get_existing_line(order, item)
+        OrderItem.objects.filter(
+            order_id=order.pk, item_id=item.pk).delete()
+        totals = update_totals(order, -old_unit_amount * old_quantity)
+    return 0, totals
@@ -0,0 +1,142 @@
+"""Применение событий вебхуков Stripe к заказам."""
+import logging
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, OrderStatus, StripeEvent
+from .pricing import get_payment_intent_amount
+
+logger = logging.getLogger(__name__)
+
+EVENT_STATUSES = {
+    'payment_intent.succeeded': OrderStatus.PAID,
+    'payment_intent.payment_failed': OrderStatus.FAILED,
+    'payment_intent.canceled': OrderStatus.CANCELED,
+    'checkout.session.completed': OrderStatus.PAID,
+    'checkout.session.async_payment_succeeded': OrderStatus.PAID,
+    'checkout.session.async_payment_failed': OrderStatus.FAILED,
+}
+
+
+def get_order_update(event):
+    """(id заказа, статус, id платежа, объект Stripe) или None."""
+    status = EVENT_STATUSES.get(event.event_type)
+    if status is None:
+        return None
+    stripe_object = event.payload.get('data', {}).get('object', {})
+    metadata = stripe_object.get('metadata') or {}
+    try:
+        order_id = uuid.UUID(str(metadata.get('order_id')))
+    except ValueError:
+        return None
+    # Отложенные способы оплаты завершают сессию до поступления денег.
+    if (
+        event.event_type == 'checkout.session.completed'
+        and stripe_object.get('payment_status') != 'paid'
+    ):
+        return None
+    if stripe_object.get('object') == 'payment_intent':
+        payment_intent_id = stripe_object.get('id')
+    else:
+        payment_intent_id = stripe_object.get('payment_intent')
+    return order_id, status, payment_intent_id or '', stripe_object
+
+
+def is_paid_amount_valid(order, stripe_object):
+    """Совпадают ли сумма и валюта оплаты с сохраненными в заказе.
+
+    У Checkout Session сверяется сумма позиций (налог и скидку
+    считает Stripe), у Payment Intent — сумма, с которой он создается.
+    """
+    if stripe_object.get('currency') != order.currency:
+        return False
+    totals = order.get_stored_totals()
+    if stripe_object.get('object') == 'payment_intent':
+        return stripe_object.get('amount') == get_payment_intent_amount(
+            totals, bool(order.tax_id))
+    return stripe_object.get('amount_subtotal') == totals.subtotal
+
+
+def apply_event(order, event, update):
+    """Применяет событие к заказу в памяти; True, если заказ изменен.
+
+    События старше уже примененного (Order.stripe_event_at) не меняют
+    заказ: Stripe не гарантирует порядок доставки, и запоздавшее
+    событие может прийти в следующей пачке. Оплаченный заказ остается
+    оплаченным — ошибка или отмена другого платежа его не отменяет.
+    Оплата, не совпавшая с заказом, не применяется, а причина
+    записывается в event.error для ручного разбора.
+    """
+    status, payment_intent_id, stripe_object = update
+    if order.stripe_event_at and event.stripe_created < order.stripe_event_at:
+        return False
+    if order.status == OrderStatus.PAID and status != OrderStatus.PAID:
+        return False
+    if (
+        status == OrderStatus.PAID
+        and not is_paid_amount_valid(order, stripe_object)
+    ):
+        event.error = (
+            f'Оплата {stripe_object.get("id")} не совпадает с заказом '
+            'по сумме или валюте'
+        )
+        logger.error(
+            'Событие %s, заказ %s: %s; статус не изменен',
+            event.event_id, order.pk, event.error
+        )
+        return False
+    order.status = status
+    order.stripe_event_at = event.stripe_created
+    if payment_intent_id:
+        order.payment_intent_id = payment_intent_id
+    return True
+
+
+def process_stripe_events(batch_size=500):
+    """Обрабатывает пачку необработанных событий.
+
+    События применяются к заказам по порядку времени Stripe (см.
+    apply_event()), измененные заказы сохраняются одним bulk_update.
+    Непримененные из-за ошибки события помечаются полем error.
+    Возвращает число событий.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('stripe_created', 'id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        updates = []
+        for event in events:
+            update = get_order_update(event)
+            if update:
+                order_id, *update = update
+                updates.append((order_id, event, update))
+
+        orders = Order.objects.select_for_update().only(
+            'id', 'status', 'payment_intent_id', 'stripe_event_at',
+            'currency', 'tax_id', 'subtotal_amount', 'tax_amount',
+            'discount_amount', 'total_amount'
+        ).in_bulk({order_id for order_id, _, _ in updates})
+        changed = {}
+        for order_id, event, update in updates:
+            order = orders.get(order_id)
+            if order is not None and apply_event(order, event, update):
+                changed[order_id] = order
+        Order.objects.bulk_update(
+            changed.values(),
+            ['status', 'payment_intent_id', 'stripe_event_at']
+        )
+        StripeEvent.objects.bulk_update(
+            [event for event in events if event.error], ['error'])
+
+        StripeEvent.objects.filter(
+            pk__in=[event.pk for event in events]
+        ).update(processed_at=timezone.now())
+    return len(events)
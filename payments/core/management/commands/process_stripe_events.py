@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.events import process_stripe_events
+
+
+class Command(BaseCommand):
+    help = 'Применяет сохраненные события вебхуков Stripe к заказам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько событий обрабатывать за одну транзакцию.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Пауза в секундах, когда новых событий нет.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать накопленные события и завершиться.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_stripe_events(options['batch_size'])
+            if processed:
+                self.stdout.write(f'Обработано событий: {processed}')
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
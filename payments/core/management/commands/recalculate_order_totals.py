@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import Order, OrderItem, OrderStatus
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохраненные суммы заказов после изменения налогов, '
+        'скидок или цен товаров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tax', type=int, action='append', default=[],
+            help='Заказы с этим налогом (можно указать несколько раз).'
+        )
+        parser.add_argument(
+            '--discount', type=int, action='append', default=[],
+            help='Заказы с этой скидкой (можно указать несколько раз).'
+        )
+        parser.add_argument(
+            '--item', type=int, action='append', default=[],
+            help='Заказы с этим товаром (можно указать несколько раз).'
+        )
+        parser.add_argument(
+            '--status', action='append', default=[],
+            choices=[*OrderStatus.values, 'all'],
+            help=(
+                'Статусы заказов, по умолчанию только pending. Заказы с '
+                'Checkout Session или Payment Intent не пересчитываются.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help='Сколько заказов обновлять одним UPDATE.'
+        )
+        parser.add_argument(
+            '--resume-after', default=None,
+            help='Продолжить с заказа, следующего за этим id.'
+        )
+
+    def get_queryset(self, options):
+        # Суммы заказа, уже переданного в Stripe, зафиксированы вместе с
+        # объектом оплаты (StripeIdempotencyMixin.get_totals_fields):
+        # по ним вебхук сверяет оплаченную сумму.
+        orders = Order.objects.filter(
+            checkout_session_id='', payment_intent_id='')
+        statuses = options['status'] or [OrderStatus.PENDING]
+        if 'all' not in statuses:
+            orders = orders.filter(status__in=statuses)
+        affected = Q()
+        if options['tax']:
+            affected |= Q(tax_id__in=options['tax'])
+        if options['discount']:
+            affected |= Q(discount_id__in=options['discount'])
+        if options['item']:
+            affected |= Q(pk__in=OrderItem.objects.filter(
+                item_id__in=options['item']).values('order_id'))
+        return orders.filter(affected).order_by('pk')
+
+    def handle(self, *args, **options):
+        orders = self.get_queryset(options)
+        batch_size = options['batch_size']
+        last_pk = options['resume_after']
+        if last_pk:
+            orders = orders.filter(pk__gt=last_pk)
+        total = orders.count()
+        done = 0
+        while True:
+            # Граница пачки по первичному ключу: в Python попадает
+            # только один id, а не вся пачка.
+            batch = orders.filter(pk__gt=last_pk) if last_pk else orders
+            boundary = list(
+                batch.values_list('pk', flat=True)[
+                    batch_size - 1:batch_size])
+            if boundary:
+                batch = batch.filter(pk__lte=boundary[0])
+            with transaction.atomic():
+                done += batch.recalculate_totals()
+            if not boundary:
+                break
+            last_pk = boundary[0]
+            self.stdout.write(
+                f'Пересчитано {done} из {total}, '
+                f'продолжить: --resume-after {last_pk}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано заказов: {done}'))
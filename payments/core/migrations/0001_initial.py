@@ -0,0 +1,95 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:54
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Discount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('percent_off', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MinValueValidator(100)], verbose_name='Проценты')),
+                ('coupon_id', models.CharField(blank=True, max_length=100, verbose_name='ID купона')),
+                ('duration', models.CharField(choices=[('once', 'Один раз'), ('forever', 'Навсегда'), ('repeating', 'Повторяющаяся')], default='once', max_length=20, verbose_name='Длительность')),
+            ],
+            options={
+                'verbose_name': 'Скидка',
+                'verbose_name_plural': 'Скидки',
+            },
+        ),
+        migrations.CreateModel(
+            name='Item',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('description', models.TextField(verbose_name='Описание')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Цена')),
+                ('currency', models.CharField(choices=[('usd', 'Dollar'), ('eur', 'Euro')], default='usd', max_length=3, verbose_name='Валюта')),
+            ],
+            options={
+                'verbose_name': 'Товар',
+                'verbose_name_plural': 'Товары',
+            },
+        ),
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID заказа')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('payment_intent_id', models.CharField(blank=True, max_length=100, verbose_name='ID платежа')),
+                ('discount', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.discount', verbose_name='Скидка')),
+            ],
+            options={
+                'verbose_name': 'Заказ',
+                'verbose_name_plural': 'Заказы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tax',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Ставка')),
+                ('tax_type', models.CharField(choices=[('vat', 'VAT'), ('sales_tax', 'Sales Tax'), ('gst', 'GST')], default='vat', max_length=20, verbose_name='Тип')),
+                ('tax_id', models.CharField(blank=True, max_length=100, verbose_name='ID налога')),
+                ('country', models.CharField(default='US', max_length=2, verbose_name='Страна')),
+            ],
+            options={
+                'verbose_name': 'Налог',
+                'verbose_name_plural': 'Налоги',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.item')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_items', to='core.order', verbose_name='Заказ')),
+            ],
+            options={
+                'unique_together': {('order', 'item')},
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='items',
+            field=models.ManyToManyField(through='core.OrderItem', to='core.item', verbose_name='Товары'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.tax', verbose_name='Налог'),
+        ),
+    ]
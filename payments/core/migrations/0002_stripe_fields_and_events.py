@@ -0,0 +1,84 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=100, unique=True, verbose_name='ID события')),
+                ('event_type', models.CharField(max_length=100, verbose_name='Тип')),
+                ('payload', models.JSONField(verbose_name='Данные')),
+                ('stripe_created', models.DateTimeField(verbose_name='Дата создания в Stripe')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата получения')),
+                ('processed_at', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата обработки')),
+            ],
+            options={
+                'verbose_name': 'Событие Stripe',
+                'verbose_name_plural': 'События Stripe',
+            },
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_price_data',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Данные цены для Stripe'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='stripe_price_data_version',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Версия данных цены'),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout_created_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата создания сессии оплаты'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш заказа для сессии оплаты'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='checkout_session_id',
+            field=models.CharField(blank=True, max_length=100, verbose_name='ID сессии оплаты'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_intent_created_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата создания платежа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='payment_intent_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш заказа для платежа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает оплаты'), ('paid', 'Оплачен'), ('failed', 'Ошибка оплаты'), ('canceled', 'Отменен')], default='pending', max_length=20, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='currency',
+            field=models.CharField(choices=[('usd', 'Dollar'), ('eur', 'Euro')], db_index=True, default='usd', max_length=3, verbose_name='Валюта'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата создания'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_stripe_fields_and_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(choices=[('usd', 'Dollar'), ('eur', 'Euro')], db_index=True, default='usd', max_length=3, verbose_name='Валюта'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='payment_intent_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, verbose_name='ID платежа'),
+        ),
+    ]
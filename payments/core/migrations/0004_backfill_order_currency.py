@@ -0,0 +1,26 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_currency(apps, schema_editor):
+    """Заполняет валюту заказа по первому товару одним UPDATE."""
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    first_item_currency = OrderItem.objects.filter(
+        order=OuterRef('pk')
+    ).order_by('pk').values('item__currency')[:1]
+    Order.objects.update(
+        currency=Coalesce(Subquery(first_item_currency), Value('usd')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_order_currency_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_order_currency, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_backfill_order_currency'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Скидка, центы'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal_amount',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Сумма позиций, центы'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='tax_amount',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Налог, центы'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Итого, центы'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+from django.db.models import (
+    BigIntegerField,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from core.pricing import cents_expression, rate_expression
+
+
+def backfill_order_totals(apps, schema_editor):
+    """Заполняет сохраненные суммы заказов одним UPDATE.
+
+    Повторяет OrderQuerySet.recalculate_totals() на исторических
+    моделях: менеджер модели в миграции не знает методов OrderQuerySet.
+    """
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    Tax = apps.get_model('core', 'Tax')
+    Discount = apps.get_model('core', 'Discount')
+    subtotal = Coalesce(
+        Subquery(
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(
+                subtotal=Sum(
+                    F('quantity') * cents_expression(F('item__price')),
+                    output_field=BigIntegerField()
+                )
+            )
+            .values('subtotal'),
+            output_field=BigIntegerField()
+        ),
+        Value(0)
+    )
+    tax = rate_expression(
+        subtotal,
+        cents_expression(Subquery(
+            Tax.objects.filter(pk=OuterRef('tax_id')).values('rate')))
+    )
+    discount = rate_expression(
+        subtotal + tax,
+        cents_expression(Subquery(
+            Discount.objects.filter(pk=OuterRef('discount_id'))
+            .values('percent_off')
+        ))
+    )
+    Order.objects.update(
+        subtotal_amount=subtotal,
+        tax_amount=tax,
+        discount_amount=discount,
+        total_amount=subtotal + tax - discount,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_order_stored_totals'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            backfill_order_totals, migrations.RunPython.noop),
+    ]
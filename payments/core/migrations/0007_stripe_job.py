@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:22
+
+from django.db import migrations, models
+import django.utils.timezone
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_backfill_order_stored_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='ID задачи')),
+                ('kind', models.CharField(choices=[('item_checkout', 'Checkout Session товара'), ('item_payment_intent', 'Payment Intent товара'), ('order_checkout', 'Checkout Session заказа'), ('order_payment_intent', 'Payment Intent заказа')], max_length=30, verbose_name='Вид')),
+                ('object_id', models.CharField(max_length=36, verbose_name='ID товара или заказа')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('succeeded', 'Выполнена'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Запустить после')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='Результат')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Задача Stripe',
+                'verbose_name_plural': 'Задачи Stripe',
+                'indexes': [models.Index(fields=['status', 'run_after'], name='core_stripe_status_1a6c40_idx')],
+            },
+        ),
+    ]
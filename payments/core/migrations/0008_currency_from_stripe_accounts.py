@@ -0,0 +1,24 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:41
+
+import core.stripe_accounts
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_stripe_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='currency',
+            field=models.CharField(db_index=True, default='usd', max_length=3, validators=[core.stripe_accounts.validate_currency], verbose_name='Валюта'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='currency',
+            field=models.CharField(db_index=True, default='usd', max_length=3, verbose_name='Валюта'),
+        ),
+    ]
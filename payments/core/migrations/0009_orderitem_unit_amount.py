@@ -0,0 +1,83 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:58
+
+from django.db import migrations, models
+from django.db.models import (
+    BigIntegerField,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+
+from core.pricing import cents_expression, rate_expression
+
+
+def backfill_unit_amount(apps, schema_editor):
+    """Заполняет цены позиций и пересчитывает по ним pending-заказы.
+
+    Повторяет OrderQuerySet.recalculate_totals() на исторических
+    моделях. Оплаченные заказы и заказы, уже переданные в Stripe,
+    сохраняют свои суммы: по ним сверяется оплата.
+    """
+    Order = apps.get_model('core', 'Order')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    Item = apps.get_model('core', 'Item')
+    Tax = apps.get_model('core', 'Tax')
+    Discount = apps.get_model('core', 'Discount')
+    OrderItem.objects.update(unit_amount=cents_expression(Subquery(
+        Item.objects.filter(pk=OuterRef('item_id')).values('price'))))
+    subtotal = Coalesce(
+        Subquery(
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .order_by()
+            .values('order')
+            .annotate(
+                subtotal=Sum(
+                    F('quantity') * F('unit_amount'),
+                    output_field=BigIntegerField()
+                )
+            )
+            .values('subtotal'),
+            output_field=BigIntegerField()
+        ),
+        Value(0)
+    )
+    tax = rate_expression(
+        subtotal,
+        cents_expression(Subquery(
+            Tax.objects.filter(pk=OuterRef('tax_id')).values('rate')))
+    )
+    discount = rate_expression(
+        subtotal + tax,
+        cents_expression(Subquery(
+            Discount.objects.filter(pk=OuterRef('discount_id'))
+            .values('percent_off')
+        ))
+    )
+    Order.objects.filter(
+        status='pending', checkout_session_id='', payment_intent_id=''
+    ).update(
+        subtotal_amount=subtotal,
+        tax_amount=tax,
+        discount_amount=discount,
+        total_amount=subtotal + tax - discount,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_currency_from_stripe_accounts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_amount',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Цена за единицу, центы'),
+        ),
+        migrations.RunPython(
+            backfill_unit_amount, migrations.RunPython.noop),
+    ]
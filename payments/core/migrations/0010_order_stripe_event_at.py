@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_orderitem_unit_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stripe_event_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Дата последнего события Stripe'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.27 on 2026-10-17 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_order_stripe_event_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='error',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Ошибка'),
+        ),
+    ]
@@ -1,8 +1,35 @@
+import hashlib
+import json
 import uuid
-from decimal import Decimal
 
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import (
+    BigIntegerField,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .pricing import (
+    OrderTotals,
+    cents_expression,
+    from_cents,
+    get_order_totals,
+    rate_expression,
+    to_cents,
+)
+from .stripe_accounts import validate_currency
+
+# Версия формата Item.stripe_price_data: при изменении формата
+# сохраненные данные устаревшей версии собираются заново.
+PRICE_DATA_VERSION = 1
 
 
 class DurationChoices(models.TextChoices):
@@ -14,12 +41,39 @@ class DurationChoices(models.TextChoices):
 
 
 class Currency(models.TextChoices):
-    """Варианты налогов."""
+    """Базовые валюты; полный список задает реестр аккаунтов Stripe."""
 
     USD = 'usd', 'Dollar'
     EUR = 'eur', 'Euro'
 
 
+class OrderStatus(models.TextChoices):
+    """Статусы оплаты заказа."""
+
+    PENDING = 'pending', 'Ожидает оплаты'
+    PAID = 'paid', 'Оплачен'
+    FAILED = 'failed', 'Ошибка оплаты'
+    CANCELED = 'canceled', 'Отменен'
+
+
+class StripeJobKind(models.TextChoices):
+    """Виды фоновых задач Stripe."""
+
+    ITEM_CHECKOUT = 'item_checkout', 'Checkout Session товара'
+    ITEM_PAYMENT_INTENT = 'item_payment_intent', 'Payment Intent товара'
+    ORDER_CHECKOUT = 'order_checkout', 'Checkout Session заказа'
+    ORDER_PAYMENT_INTENT = 'order_payment_intent', 'Payment Intent заказа'
+
+
+class StripeJobStatus(models.TextChoices):
+    """Статусы фоновых задач Stripe."""
+
+    QUEUED = 'queued', 'В очереди'
+    RUNNING = 'running', 'Выполняется'
+    SUCCEEDED = 'succeeded', 'Выполнена'
+    FAILED = 'failed', 'Ошибка'
+
+
 class TaxType(models.TextChoices):
     """Варианты валют."""
 
@@ -39,16 +93,69 @@ class Item(models.Model):
         decimal_places=2,
         validators=[MinValueValidator(0)]
     )
+    # Список валют не зашит в код: допустимы валюты, для которых в
+    # реестре аккаунтов Stripe есть аккаунт (core/stripe_accounts.py).
     currency = models.CharField(
         'Валюта',
         max_length=3,
-        choices=Currency.choices,
-        default=Currency.USD
+        default=Currency.USD,
+        db_index=True,
+        validators=[validate_currency]
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True, db_index=True)
+    stripe_price_data = models.JSONField(
+        'Данные цены для Stripe', default=dict, editable=False)
+    stripe_price_data_version = models.PositiveSmallIntegerField(
+        'Версия данных цены', default=0, editable=False)
 
     def __str__(self):
         return f'{self.name} - {self.price} {self.currency}'
 
+    def save(self, *args, **kwargs):
+        self.stripe_price_data = self.build_price_data()
+        self.stripe_price_data_version = PRICE_DATA_VERSION
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {
+                *update_fields,
+                'stripe_price_data',
+                'stripe_price_data_version',
+            }
+        super().save(*args, **kwargs)
+
+    def build_price_data(self):
+        """Собирает price_data позиции Stripe Checkout для товара."""
+        return {
+            'currency': self.currency,
+            'product_data': {
+                'name': self.name,
+                'description': self.description,
+            },
+            'unit_amount': to_cents(self.price),
+        }
+
+    def get_price_data(self):
+        """Возвращает сохраненный price_data, если он совпадает с товаром.
+
+        Сохраненные данные отдаются, только если они актуальной версии
+        и их цена, валюта, название и описание равны текущим полям
+        товара. Иначе — у товаров, измененных в обход save() (update(),
+        bulk_update(), bulk_create), — данные собираются заново из полей.
+        """
+        data = self.stripe_price_data
+        if (
+            self.stripe_price_data_version == PRICE_DATA_VERSION
+            and data.get('unit_amount') == to_cents(self.price)
+            and data.get('currency') == self.currency
+            and data.get('product_data') == {
+                'name': self.name,
+                'description': self.description,
+            }
+        ):
+            return data
+        return self.build_price_data()
+
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
@@ -107,6 +214,135 @@ class Tax(models.Model):
         verbose_name_plural = 'Налоги'
 
 
+class OrderQuerySet(models.QuerySet):
+    """Запросы для заказов."""
+
+    def with_related(self):
+        """Загружает налог, скидку и позиции с товарами заранее.
+
+        Весь граф заказа поднимается двумя запросами, дальнейшие
+        обращения к order_items, item, tax и discount идут из памяти.
+        """
+        return self.select_related('tax', 'discount').prefetch_related(
+            Prefetch(
+                'order_items',
+                queryset=OrderItem.objects.select_related('item')
+            )
+        )
+
+    def with_totals(self):
+        """Добавляет суммы заказа в центах, рассчитанные одним SQL.
+
+        Аннотации: subtotal_cents (сумма позиций), tax_cents (налог),
+        discount_cents (скидка) и total_cents (итог). Округление то же,
+        что и в core.pricing.calculate_totals().
+        """
+        return self.annotate(
+            subtotal_cents=get_subtotal_expression(),
+            tax_basis_points=cents_expression(F('tax__rate')),
+            discount_basis_points=cents_expression(
+                F('discount__percent_off')),
+        ).annotate(
+            tax_cents=rate_expression(
+                F('subtotal_cents'), F('tax_basis_points')),
+        ).annotate(
+            discount_cents=rate_expression(
+                F('subtotal_cents') + F('tax_cents'),
+                F('discount_basis_points')
+            ),
+        ).annotate(
+            total_cents=ExpressionWrapper(
+                F('subtotal_cents') + F('tax_cents') - F('discount_cents'),
+                output_field=BigIntegerField()
+            )
+        )
+
+    def recalculate_totals(self):
+        """Пересчитывает сохраненные суммы заказов по текущим ценам.
+
+        Заказы не загружаются в Python: сначала один UPDATE переносит
+        текущие цены товаров в цены позиций (OrderItem.unit_amount),
+        затем второй считает суммы подзапросами по позициям. Возвращает
+        число обновленных заказов.
+        """
+        OrderItem.objects.filter(
+            order_id__in=self.values('pk')
+        ).update(unit_amount=cents_expression(Subquery(
+            Item.objects.filter(pk=OuterRef('item_id')).values('price'))))
+        subtotal = get_subtotal_expression(F('unit_amount'))
+        tax = rate_expression(
+            subtotal,
+            cents_expression(Subquery(
+                Tax.objects.filter(pk=OuterRef('tax_id')).values('rate')))
+        )
+        discount = rate_expression(
+            subtotal + tax,
+            cents_expression(Subquery(
+                Discount.objects.filter(pk=OuterRef('discount_id'))
+                .values('percent_off')
+            ))
+        )
+        return self.update(
+            subtotal_amount=subtotal,
+            tax_amount=tax,
+            discount_amount=discount,
+            total_amount=subtotal + tax - discount,
+        )
+
+    def add_to_totals(
+        self, subtotal_delta, tax_basis_points, discount_basis_points,
+        **fields
+    ):
+        """Сдвигает сохраненные суммы на subtotal_delta центов.
+
+        Позиции не пересчитываются: subtotal_delta — разница сумм
+        измененной позиции по ее сохраненной цене (unit_amount), новая
+        сумма позиций — F-выражение от сохраненной, налог и скидка
+        считаются от нее в том же UPDATE с тем же округлением, что и в
+        recalculate_totals(). Справа в UPDATE столбцы имеют значения до
+        изменения, поэтому одновременные правки одного заказа не
+        теряются.
+        """
+        subtotal = ExpressionWrapper(
+            F('subtotal_amount') + Value(subtotal_delta),
+            output_field=BigIntegerField()
+        )
+        tax = rate_expression(subtotal, Value(tax_basis_points))
+        discount = rate_expression(
+            subtotal + tax, Value(discount_basis_points))
+        return self.update(
+            subtotal_amount=subtotal,
+            tax_amount=tax,
+            discount_amount=discount,
+            total_amount=subtotal + tax - discount,
+            **fields
+        )
+
+
+def get_subtotal_expression(unit_amount=None):
+    """SQL: сумма позиций заказа в центах.
+
+    unit_amount — цена позиции в центах, по умолчанию текущая цена
+    товара.
+    """
+    if unit_amount is None:
+        unit_amount = cents_expression(F('item__price'))
+    subtotal = Subquery(
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(
+            subtotal=Sum(
+                F('quantity') * unit_amount,
+                output_field=BigIntegerField()
+            )
+        )
+        .values('subtotal'),
+        output_field=BigIntegerField()
+    )
+    return Coalesce(subtotal, Value(0))
+
+
 class Order(models.Model):
     id = models.UUIDField(
         'ID заказа',
@@ -131,33 +367,122 @@ class Order(models.Model):
         null=True,
         blank=True
     )
-    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    created_at = models.DateTimeField(
+        'Дата создания', auto_now_add=True, db_index=True)
+    status = models.CharField(
+        'Статус',
+        max_length=20,
+        choices=OrderStatus.choices,
+        default=OrderStatus.PENDING
+    )
+    currency = models.CharField(
+        'Валюта',
+        max_length=3,
+        default=Currency.USD,
+        db_index=True
+    )
     payment_intent_id = models.CharField(
         'ID платежа',
         max_length=100,
-        blank=True
+        blank=True,
+        db_index=True
     )
+    payment_intent_hash = models.CharField(
+        'Хэш заказа для платежа', max_length=64, blank=True)
+    payment_intent_created_at = models.DateTimeField(
+        'Дата создания платежа', null=True, blank=True)
+    checkout_session_id = models.CharField(
+        'ID сессии оплаты', max_length=100, blank=True)
+    checkout_hash = models.CharField(
+        'Хэш заказа для сессии оплаты', max_length=64, blank=True)
+    checkout_created_at = models.DateTimeField(
+        'Дата создания сессии оплаты', null=True, blank=True)
+    # Время Stripe последнего примененного события вебхука: более
+    # старые события статус не меняют (core/events.py).
+    stripe_event_at = models.DateTimeField(
+        'Дата последнего события Stripe', null=True, blank=True,
+        editable=False)
+    # Сохраненные суммы в центах; пересчитываются recalculate_totals()
+    # и командой recalculate_order_totals.
+    subtotal_amount = models.BigIntegerField(
+        'Сумма позиций, центы', default=0, editable=False)
+    tax_amount = models.BigIntegerField(
+        'Налог, центы', default=0, editable=False)
+    discount_amount = models.BigIntegerField(
+        'Скидка, центы', default=0, editable=False)
+    total_amount = models.BigIntegerField(
+        'Итого, центы', default=0, editable=False)
+
+    objects = OrderQuerySet.as_manager()
+
+    def get_totals(self):
+        """Суммы заказа в центах (core.pricing.OrderTotals).
+
+        Берутся из аннотаций Order.objects.with_totals(), если они есть.
+        """
+        if hasattr(self, 'total_cents'):
+            return OrderTotals(
+                self.subtotal_cents, self.tax_cents, self.discount_cents,
+                self.total_cents
+            )
+        return get_order_totals(self)
+
+    def get_stored_totals(self):
+        """Сохраненные суммы заказа (поля *_amount) в OrderTotals."""
+        return OrderTotals(
+            self.subtotal_amount, self.tax_amount, self.discount_amount,
+            self.total_amount
+        )
 
     def get_total_price(self):
         """Рассчитываеn общую сумму заказа"""
-        total = Decimal('0')
-
-        for order_item in self.order_items.all():
-            total += order_item.item.price * order_item.quantity
-
-        if self.tax:
-            total += total * (self.tax.rate / Decimal('100'))
-
-        if self.discount:
-            total -= total * (self.discount.percent_off / Decimal('100'))
-
-        return total
+        return from_cents(self.get_totals().total)
+
+    def get_content_hash(self):
+        """Хэш всего, что уходит в Stripe: позиции, налог, скидка, валюта.
+
+        Позиции берутся в виде price_data (валюта, название, описание и
+        цена товара) с количеством, налог — со ставкой, названием и
+        tax_id, скидка — с купоном. Одинаковый хэш означает, что
+        созданный ранее объект Stripe для заказа совпадает с заказом по
+        содержимому.
+        """
+        content = {
+            'currency': self.currency,
+            'items': sorted(
+                (
+                    (
+                        order_item.item_id,
+                        order_item.quantity,
+                        order_item.item.get_price_data(),
+                    )
+                    for order_item in self.order_items.all()
+                ),
+                key=lambda line: line[0]
+            ),
+            'tax': self.tax and (
+                self.tax.pk,
+                str(self.tax.rate),
+                self.tax.name,
+                self.tax.tax_id,
+            ),
+            'discount': self.discount and (
+                self.discount.pk,
+                str(self.discount.percent_off),
+                self.discount.coupon_id,
+            ),
+        }
+        return hashlib.sha256(json.dumps(
+            content, ensure_ascii=False, sort_keys=True).encode()
+        ).hexdigest()
 
     def get_currency(self):
-        items = self.items.all()
+        return self.currency
 
-        if items.exists():
-            return items.first().currency
+    def get_items_currency(self):
+        """Валюта по товарам заказа (для пересчета поля currency)."""
+        for order_item in self.order_items.all():
+            return order_item.item.currency
 
         return Currency.USD
 
@@ -180,6 +505,69 @@ class OrderItem(models.Model):
     )
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
+    # Цена товара, по которой позиция вошла в сохраненные суммы заказа;
+    # обновляется recalculate_totals() и при изменении позиции.
+    unit_amount = models.BigIntegerField(
+        'Цена за единицу, центы', default=0, editable=False)
 
     class Meta:
         unique_together = ('order', 'item')
+
+
+class StripeEvent(models.Model):
+    """Событие вебхука Stripe, ожидающее обработки."""
+
+    event_id = models.CharField('ID события', max_length=100, unique=True)
+    event_type = models.CharField('Тип', max_length=100)
+    payload = models.JSONField('Данные')
+    stripe_created = models.DateTimeField('Дата создания в Stripe')
+    received_at = models.DateTimeField('Дата получения', auto_now_add=True)
+    processed_at = models.DateTimeField(
+        'Дата обработки', null=True, blank=True, db_index=True)
+    # Обработанное, но не примененное событие, которое нужно разобрать
+    # вручную (например, оплата не совпала с заказом по сумме).
+    error = models.CharField('Ошибка', max_length=255, blank=True)
+
+    def __str__(self):
+        return f'{self.event_id} - {self.event_type}'
+
+    class Meta:
+        verbose_name = 'Событие Stripe'
+        verbose_name_plural = 'События Stripe'
+
+
+class StripeJob(models.Model):
+    """Фоновая задача создания объекта Stripe.
+
+    Очередь хранится в БД: задачу выполняет пул потоков в процессе
+    приложения или команда process_stripe_jobs.
+    """
+
+    id = models.UUIDField(
+        'ID задачи', primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(
+        'Вид', max_length=30, choices=StripeJobKind.choices)
+    object_id = models.CharField('ID товара или заказа', max_length=36)
+    status = models.CharField(
+        'Статус',
+        max_length=20,
+        choices=StripeJobStatus.choices,
+        default=StripeJobStatus.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    # Для задачи в очереди — не раньше какого времени запускать, для
+    # выполняемой — когда считать ее брошенной и запускать заново.
+    run_after = models.DateTimeField('Запустить после', default=timezone.now)
+    result = models.JSONField('Результат', null=True, blank=True)
+    error = models.TextField('Ошибка', blank=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+    finished_at = models.DateTimeField(
+        'Дата завершения', null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} - {self.status}'
+
+    class Meta:
+        verbose_name = 'Задача Stripe'
+        verbose_name_plural = 'Задачи Stripe'
+        indexes = [models.Index(fields=['status', 'run_after'])]
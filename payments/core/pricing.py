@@ -0,0 +1,124 @@
+"""Расчет цен в целых центах (минимальных единицах валюты).
+
+Все суммы заказа считаются в int: цены товаров переводятся в центы
+один раз, ставки налога и скидки — в базисные пункты (20.00% = 2000),
+а округление налога и скидки — до цента, половина вверх, как у Stripe.
+Один и тот же расчет есть в двух видах: на Python (calculate_totals)
+и выражениями SQL для аннотаций сразу по многим заказам
+(Order.objects.with_totals()).
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple
+
+from django.db.models import BigIntegerField, ExpressionWrapper, Value
+from django.db.models.functions import Cast, Coalesce, Round
+
+CENTS_PER_UNIT = 100
+BASIS_POINTS = 10000
+
+# Валюты, у которых минимальная единица Stripe — не сотая доля:
+# показатель степени 10 (по документации Stripe). Все расчеты здесь
+# ведутся в сотых (CENTS_PER_UNIT), поэтому такие валюты не
+# принимаются в конфигурацию аккаунтов (core.stripe_accounts).
+CURRENCY_EXPONENTS = {
+    **dict.fromkeys(
+        (
+            'bif', 'clp', 'djf', 'gnf', 'jpy', 'kmf', 'krw', 'mga', 'pyg',
+            'rwf', 'ugx', 'vnd', 'vuv', 'xaf', 'xof', 'xpf',
+        ),
+        0
+    ),
+    **dict.fromkeys(('bhd', 'jod', 'kwd', 'omr', 'tnd'), 3),
+}
+DEFAULT_CURRENCY_EXPONENT = 2
+
+
+class OrderTotals(NamedTuple):
+    """Суммы заказа в центах."""
+
+    subtotal: int
+    tax: int
+    discount: int
+    total: int
+
+
+def get_currency_exponent(currency):
+    """Число знаков минимальной единицы валюты (usd — 2, jpy — 0)."""
+    return CURRENCY_EXPONENTS.get(currency, DEFAULT_CURRENCY_EXPONENT)
+
+
+def is_supported_currency(currency):
+    """Считаются ли суммы валюты в сотых долях, как в этом модуле."""
+    return get_currency_exponent(currency) == DEFAULT_CURRENCY_EXPONENT
+
+
+def to_cents(amount):
+    """Decimal-сумма в целые центы с округлением половины вверх."""
+    return int(
+        (Decimal(amount) * CENTS_PER_UNIT).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Целые центы в Decimal с двумя знаками после запятой."""
+    return Decimal(cents).scaleb(-2)
+
+
+def to_basis_points(percent):
+    """Процентная ставка (Decimal) в базисные пункты."""
+    return to_cents(percent)
+
+
+def apply_rate(cents, basis_points):
+    """Доля от суммы в центах, округленная до цента половиной вверх."""
+    return (cents * basis_points + BASIS_POINTS // 2) // BASIS_POINTS
+
+
+def calculate_totals(lines, tax_basis_points=0, discount_basis_points=0):
+    """Суммы заказа по позициям [(цена в центах, количество), ...].
+
+    Скидка применяется к сумме с налогом.
+    """
+    subtotal = sum(unit_amount * quantity for unit_amount, quantity in lines)
+    tax = apply_rate(subtotal, tax_basis_points)
+    discount = apply_rate(subtotal + tax, discount_basis_points)
+    return OrderTotals(subtotal, tax, discount, subtotal + tax - discount)
+
+
+def get_payment_intent_amount(totals, has_tax):
+    """Сумма Payment Intent заказа в центах.
+
+    С налогом — сумма позиций и налога (скидка передается в Stripe
+    купоном), без налога — итог заказа.
+    """
+    if has_tax:
+        return totals.subtotal + totals.tax
+    return totals.total
+
+
+def get_order_totals(order):
+    """Суммы заказа по загруженным позициям, налогу и скидке."""
+    return calculate_totals(
+        [
+            (to_cents(order_item.item.price), order_item.quantity)
+            for order_item in order.order_items.all()
+        ],
+        to_basis_points(order.tax.rate) if order.tax else 0,
+        to_basis_points(order.discount.percent_off) if order.discount else 0,
+    )
+
+
+def cents_expression(expression):
+    """SQL: Decimal-сумма или ставка в целые центы (базисные пункты)."""
+    return Cast(
+        Round(expression * Value(CENTS_PER_UNIT)),
+        output_field=BigIntegerField()
+    )
+
+
+def rate_expression(cents, basis_points):
+    """SQL-аналог apply_rate(): целочисленное деление с округлением."""
+    return ExpressionWrapper(
+        (cents * Coalesce(basis_points, Value(0)) + Value(BASIS_POINTS // 2))
+        / Value(BASIS_POINTS),
+        output_field=BigIntegerField()
+    )
@@ -0,0 +1,266 @@
+"""Реестр аккаунтов Stripe: какой аккаунт принимает какую валюту.
+
+Аккаунты описываются JSON-файлом STRIPE_ACCOUNTS_FILE:
+
+    {
+        "default": "us",
+        "accounts": {
+            "us": {
+                "publishable_key": "pk_live_...",
+                "secret_key": "sk_live_...",
+                "webhook_secret": "whsec_...",
+                "currencies": ["usd", "cad"],
+                "regions": ["US", "CA"]
+            },
+            "eu": {...}
+        }
+    }
+
+Валюты без своего аккаунта уходят в аккаунт default (если он задан).
+Допустимы только валюты с минимальной единицей в сотую долю
+(core.pricing.is_supported_currency): jpy, krw, kwd и подобные
+отклоняются при проверке.
+Без файла реестр собирается из прежних переменных STRIPE_*_KEY (usd и
+все остальные валюты) и STRIPE_*_KEY_EUR (eur).
+
+Реестр загружается и проверяется при старте (CoreConfig.ready()), а
+поиск аккаунта — обращение к словарю. Файл перечитывается, если он
+изменился: проверка не чаще раза в STRIPE_ACCOUNTS_RELOAD_INTERVAL
+секунд. Ошибочный новый файл не применяется — остается прежний реестр.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+
+from .pricing import is_supported_currency
+
+logger = logging.getLogger(__name__)
+
+CURRENCY_RE = re.compile(r'^[a-z]{3}$')
+REGION_RE = re.compile(r'^[A-Z]{2}$')
+
+
+class StripeAccount(NamedTuple):
+    name: str
+    publishable_key: str
+    secret_key: str
+    webhook_secret: str
+    currencies: tuple
+    regions: tuple
+
+
+class StripeAccountRegistry:
+    """Аккаунты Stripe с поиском по валюте и региону."""
+
+    def __init__(self, accounts, default=None):
+        self.accounts = {account.name: account for account in accounts}
+        self.default = self.accounts.get(default)
+        self.by_currency = {
+            currency: account
+            for account in accounts for currency in account.currencies
+        }
+        self.by_region = {
+            region: account
+            for account in accounts for region in account.regions
+        }
+        self.currencies = sorted(self.by_currency)
+        self.webhook_secrets = [
+            account.webhook_secret
+            for account in accounts if account.webhook_secret
+        ]
+
+    def get_for_currency(self, currency):
+        account = self.by_currency.get(currency, self.default)
+        if account is None:
+            raise ValueError(
+                f'Stripe-ключи не настроены для валюты: {currency}')
+        return account
+
+    def get_for_region(self, region):
+        account = self.by_region.get(region.upper(), self.default)
+        if account is None:
+            raise ValueError(
+                f'Stripe-аккаунт не настроен для региона: {region}')
+        return account
+
+
+def parse_accounts(config):
+    """Собирает реестр из словаря конфигурации, проверяя его целиком.
+
+    Все найденные ошибки попадают в одно ImproperlyConfigured.
+    """
+    errors = []
+    accounts = []
+    owners = {}
+    raw_accounts = config.get('accounts')
+    if not isinstance(raw_accounts, dict) or not raw_accounts:
+        raise ImproperlyConfigured(
+            'Stripe: в конфигурации нет ни одного аккаунта (accounts)')
+    for name, raw in raw_accounts.items():
+        publishable_key = raw.get('publishable_key') or ''
+        secret_key = raw.get('secret_key') or ''
+        if not publishable_key.startswith('pk_'):
+            errors.append(f'{name}: publishable_key должен начинаться с pk_')
+        if not secret_key.startswith(('sk_', 'rk_')):
+            errors.append(f'{name}: secret_key должен начинаться с sk_/rk_')
+        currencies = tuple(
+            currency.lower() for currency in raw.get('currencies', []))
+        regions = tuple(region.upper() for region in raw.get('regions', []))
+        for currency in currencies:
+            if not CURRENCY_RE.match(currency):
+                errors.append(f'{name}: неверный код валюты {currency!r}')
+            elif not is_supported_currency(currency):
+                errors.append(
+                    f'{name}: валюта {currency} не поддерживается: ее '
+                    f'минимальная единица не сотая доля'
+                )
+            elif currency in owners:
+                errors.append(
+                    f'{name}: валюта {currency} уже у аккаунта '
+                    f'{owners[currency]}'
+                )
+            owners.setdefault(currency, name)
+        for region in regions:
+            if not REGION_RE.match(region):
+                errors.append(f'{name}: неверный код региона {region!r}')
+        accounts.append(StripeAccount(
+            name=name,
+            publishable_key=publishable_key,
+            secret_key=secret_key,
+            webhook_secret=raw.get('webhook_secret') or '',
+            currencies=currencies,
+            regions=regions,
+        ))
+    default = config.get('default')
+    if default is not None and default not in raw_accounts:
+        errors.append(f'default: нет аккаунта {default}')
+    if errors:
+        raise ImproperlyConfigured(
+            'Stripe: ошибки в конфигурации аккаунтов:\n' + '\n'.join(errors))
+    return StripeAccountRegistry(accounts, default)
+
+
+def get_legacy_config():
+    """Конфигурация из переменных STRIPE_*_KEY и STRIPE_*_KEY_EUR."""
+    accounts = {}
+    if settings.STRIPE_SECRET_KEY and settings.STRIPE_PUBLISHABLE_KEY:
+        accounts['default'] = {
+            'publishable_key': settings.STRIPE_PUBLISHABLE_KEY,
+            'secret_key': settings.STRIPE_SECRET_KEY,
+            'webhook_secret': settings.STRIPE_WEBHOOK_SECRET,
+            'currencies': ['usd'],
+        }
+    if settings.STRIPE_SECRET_KEY_EUR and settings.STRIPE_PUBLISHABLE_KEY_EUR:
+        accounts['eur'] = {
+            'publishable_key': settings.STRIPE_PUBLISHABLE_KEY_EUR,
+            'secret_key': settings.STRIPE_SECRET_KEY_EUR,
+            'webhook_secret': settings.STRIPE_WEBHOOK_SECRET_EUR,
+            'currencies': ['eur'],
+        }
+    return {
+        'accounts': accounts,
+        'default': 'default' if 'default' in accounts else None,
+    }
+
+
+def load_registry():
+    """Читает конфигурацию и возвращает (реестр, mtime файла)."""
+    path = settings.STRIPE_ACCOUNTS_FILE
+    if not path:
+        config = get_legacy_config()
+        # Без ключей (сборка образа, тесты) реестр пустой, а ошибка
+        # будет при первом обращении к Stripe.
+        if not config['accounts']:
+            return StripeAccountRegistry([]), None
+        return parse_accounts(config), None
+    try:
+        mtime = os.stat(path).st_mtime
+        with open(path) as file:
+            config = json.load(file)
+    except (OSError, ValueError) as error:
+        raise ImproperlyConfigured(
+            f'Stripe: не удалось прочитать {path}: {error}')
+    return parse_accounts(config), mtime
+
+
+_registry = None
+_mtime = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_registry():
+    """Текущий реестр; при изменении файла перечитывает его."""
+    global _registry, _mtime, _checked_at
+    now = time.monotonic()
+    if (
+        _registry is not None
+        and now - _checked_at < settings.STRIPE_ACCOUNTS_RELOAD_INTERVAL
+    ):
+        return _registry
+    with _lock:
+        if _registry is None:
+            _registry, _mtime = load_registry()
+        elif settings.STRIPE_ACCOUNTS_FILE:
+            try:
+                mtime = os.stat(settings.STRIPE_ACCOUNTS_FILE).st_mtime
+            except OSError:
+                mtime = _mtime
+            if mtime != _mtime:
+                # Ошибочный файл логируется один раз, а не на каждой
+                # проверке: следующая попытка — после его изменения.
+                _mtime = mtime
+                try:
+                    _registry, _mtime = load_registry()
+                    logger.info('Конфигурация аккаунтов Stripe перечитана')
+                except ImproperlyConfigured:
+                    logger.exception(
+                        'Новая конфигурация аккаунтов Stripe не применена')
+        _checked_at = now
+    return _registry
+
+
+def reset_registry():
+    """Сбрасывает реестр: следующий get_registry() загрузит его заново."""
+    global _registry, _mtime
+    with _lock:
+        _registry = _mtime = None
+
+
+def get_currency_choices():
+    """Валюты для форм: все валюты, у которых есть аккаунт."""
+    currencies = get_registry().currencies
+    if not currencies:
+        from .models import Currency
+
+        return Currency.choices
+    return [(currency, currency.upper()) for currency in currencies]
+
+
+def validate_currency(value):
+    """Валидатор поля currency: валюта должна быть в реестре.
+
+    Пока аккаунты не настроены, проверяется только формат кода.
+    """
+    registry = get_registry()
+    if not CURRENCY_RE.match(value):
+        raise ValidationError(
+            'Код валюты — три строчные латинские буквы (ISO 4217).')
+    if not is_supported_currency(value):
+        raise ValidationError(
+            'Валюта %(value)s не поддерживается: цены считаются в сотых '
+            'долях.',
+            params={'value': value}
+        )
+    if registry.accounts and value not in registry.by_currency:
+        raise ValidationError(
+            'Для валюты %(value)s не настроен аккаунт Stripe.',
+            params={'value': value}
+        )
@@ -0,0 +1,73 @@
+"""Суммы заказов, переданных в Stripe, и сверка с ними оплаты."""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .events import process_stripe_events
+from .models import Item, Order, OrderItem, OrderStatus, StripeEvent
+
+
+def create_succeeded_event(order, amount):
+    return StripeEvent.objects.create(
+        event_id=f'evt_{amount}',
+        event_type='payment_intent.succeeded',
+        stripe_created=timezone.now() - timedelta(minutes=1),
+        payload={'data': {'object': {
+            'object': 'payment_intent',
+            'id': 'pi_test',
+            'amount': amount,
+            'currency': 'usd',
+            'metadata': {'order_id': str(order.pk)},
+        }}},
+    )
+
+
+class StoredTotalsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.item = Item.objects.create(
+            name='Item', description='', price=Decimal('6.66'),
+            currency='usd')
+
+    def create_order(self, **fields):
+        order = Order.objects.create(currency='usd', **fields)
+        OrderItem.objects.create(order=order, item=self.item, quantity=1)
+        Order.objects.filter(pk=order.pk).recalculate_totals()
+        return order
+
+    def test_order_with_payment_intent_keeps_totals(self):
+        submitted = self.create_order(payment_intent_id='pi_test')
+        draft = self.create_order()
+        Item.objects.filter(pk=self.item.pk).update(price=Decimal('7.77'))
+
+        call_command(
+            'recalculate_order_totals', item=[self.item.pk],
+            stdout=StringIO())
+
+        submitted.refresh_from_db()
+        draft.refresh_from_db()
+        self.assertEqual(submitted.total_amount, 666)
+        self.assertEqual(draft.total_amount, 777)
+
+        # Оплата на сумму Payment Intent засчитывается.
+        event = create_succeeded_event(submitted, 666)
+        process_stripe_events()
+        submitted.refresh_from_db()
+        event.refresh_from_db()
+        self.assertEqual(submitted.status, OrderStatus.PAID)
+        self.assertEqual(event.error, '')
+
+    def test_amount_mismatch_is_marked_for_review(self):
+        order = self.create_order(payment_intent_id='pi_test')
+        event = create_succeeded_event(order, 777)
+        process_stripe_events()
+        order.refresh_from_db()
+        event.refresh_from_db()
+        self.assertEqual(order.status, OrderStatus.PENDING)
+        self.assertIsNotNone(event.processed_at)
+        self.assertIn('pi_test', event.error)
@@ -0,0 +1,50 @@
+"""Настройки gunicorn — точка входа приложения в продакшене.
+
+    cd payments && gunicorn -c gunicorn.conf.py
+
+WEB_SERVER выбирает модель воркеров:
+
+* wsgi  — payments.wsgi в процессах gthread: WEB_WORKERS процессов по
+  WEB_THREADS потоков. Подходит, когда запросы в основном ходят в БД.
+* asgi  — payments.asgi на uvicorn-воркерах: каждый процесс держит
+  много одновременных запросов к Stripe в асинхронных представлениях.
+
+Миграции и collectstatic здесь не выполняются: их запускает один раз
+сервис migrate в docker-compose.yml (или шаг деплоя).
+"""
+import multiprocessing
+import os
+
+WEB_SERVER = os.getenv('WEB_SERVER', 'wsgi')
+if WEB_SERVER not in ('wsgi', 'asgi'):
+    raise ValueError(f'WEB_SERVER должен быть wsgi или asgi: {WEB_SERVER}')
+
+if WEB_SERVER == 'asgi':
+    wsgi_app = 'payments.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'payments.wsgi:application'
+    worker_class = 'gthread'
+
+bind = os.getenv('WEB_BIND', '0.0.0.0:8000')
+# Поток процесса занят на время запроса целиком, включая ожидание БД и
+# Stripe, поэтому процессов больше, чем ядер.
+workers = int(
+    os.getenv('WEB_WORKERS', str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('WEB_THREADS', '4'))
+# Сколько секунд держать keep-alive соединение между запросами. За
+# балансировщиком стоит сделать больше его таймаута простоя.
+keepalive = int(os.getenv('WEB_KEEPALIVE', '5'))
+timeout = int(os.getenv('WEB_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+# Перезапуск воркера после стольких запросов (0 — никогда) защищает от
+# утечек памяти; разброс не дает всем воркерам перезапуститься разом.
+max_requests = int(os.getenv('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+backlog = int(os.getenv('WEB_BACKLOG', '2048'))
+# Файлы heartbeat воркеров — в памяти, а не на диске контейнера.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+forwarded_allow_ips = os.getenv('WEB_FORWARDED_ALLOW_IPS', '127.0.0.1')
+accesslog = '-' if os.getenv('WEB_ACCESS_LOG', 'False') == 'True' else None
+errorlog = '-'
+loglevel = os.getenv('WEB_LOG_LEVEL', 'info')
@@ -3,6 +3,8 @@ from pathlib import Path
 
 from dotenv import load_dotenv
 
+from payments.database import parse_database_url
+
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,7 +28,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,12 +60,66 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'payments.wsgi.application'
 
+# По умолчанию SQLite для разработки; в продакшене PostgreSQL:
+# DATABASE_URL=postgres://user:password@db:5432/db
 DATABASES = {
+    'default': parse_database_url(
+        os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3'),
+        BASE_DIR,
+        # Соединение живет между запросами и проверяется перед повторным
+        # использованием, чтобы не открывать его на каждый запрос.
+        conn_max_age=int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        health_checks=os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        sqlite_timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+    )
+}
+
+# Локально — LocMemCache в памяти процесса (LRU с TTL), в продакшене
+# общий Redis: CACHE_BACKEND=django.core.cache.backends.redis.RedisCache,
+# CACHE_LOCATION=redis://redis:6379/0.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
     }
 }
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+    }
+# Кэш товаров, налогов и скидок (core/cache.py).
+REFERENCE_CACHE_ALIAS = 'default'
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', '3600'))
+# Метрики запросов (api/middleware.py). Заголовок Server-Timing
+# показывает время БД и Stripe любому клиенту, поэтому по умолчанию он
+# включен только при DEBUG.
+SERVER_TIMING_ENABLED = (
+    os.getenv('SERVER_TIMING_ENABLED', str(DEBUG)) == 'True')
+# Запросы дольше SLOW_REQUEST_MS пишутся в лог с самыми медленными
+# SQL-запросами; SLOW_REQUEST_SAMPLE_RATE — доля таких запросов в логе.
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '500'))
+SLOW_REQUEST_SAMPLE_RATE = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '1'))
+SLOW_REQUEST_LOG_QUERIES = int(os.getenv('SLOW_REQUEST_LOG_QUERIES', '10'))
+# Токен для /metrics; без него метрики видны только сотрудникам.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.MeasuredJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Страница товара: сколько хранить готовый HTML и сколько секунд браузер
+# и CDN могут отдавать ее без перепроверки по ETag.
+ITEM_PAGE_CACHE_TIMEOUT = int(os.getenv('ITEM_PAGE_CACHE_TIMEOUT', '3600'))
+ITEM_PAGE_MAX_AGE = int(os.getenv('ITEM_PAGE_MAX_AGE', '0'))
+# Страницы success/cancel не зависят от данных.
+STATIC_PAGE_MAX_AGE = int(
+    os.getenv('STATIC_PAGE_MAX_AGE', str(365 * 24 * 60 * 60)))
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -81,7 +139,21 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
-STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATIC_ROOT = os.getenv(
+    'STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+# Статику отдает WhiteNoise: collectstatic добавляет хэш в имена файлов и
+# сжимает их заранее (gzip, brotli), поэтому файлы с хэшем отдаются
+# сжатыми и с кэшированием на год. Без манифеста ссылки остаются без
+# хэша, а не ломают страницы.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+WHITENOISE_MANIFEST_STRICT = False
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
 USE_I18N = True
@@ -93,3 +165,58 @@ STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY_EUR = os.getenv('STRIPE_PUBLISHABLE_KEY_EUR')
 STRIPE_SECRET_KEY_EUR = os.getenv('STRIPE_SECRET_KEY_EUR')
+STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
+STRIPE_WEBHOOK_SECRET_EUR = os.getenv('STRIPE_WEBHOOK_SECRET_EUR')
+# Аккаунты Stripe по валютам (core/stripe_accounts.py). Без файла
+# используются ключи выше: *_EUR для eur, остальные для всех валют.
+STRIPE_ACCOUNTS_FILE = os.getenv('STRIPE_ACCOUNTS_FILE')
+# Как часто (в секундах) проверять, не изменился ли файл аккаунтов.
+STRIPE_ACCOUNTS_RELOAD_INTERVAL = float(
+    os.getenv('STRIPE_ACCOUNTS_RELOAD_INTERVAL', '5'))
+# Пул HTTP-соединений Stripe-клиентов (api/stripe_clients.py).
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE')
+STRIPE_HTTP_POOL_SIZE = int(os.getenv('STRIPE_HTTP_POOL_SIZE', '10'))
+# Асинхронным представлениям нужно больше соединений: одновременно
+# в ожидании Stripe находится больше запросов, чем потоков WSGI.
+STRIPE_HTTP_ASYNC_POOL_SIZE = int(
+    os.getenv('STRIPE_HTTP_ASYNC_POOL_SIZE', '100'))
+STRIPE_HTTP_CONNECT_TIMEOUT = float(
+    os.getenv('STRIPE_HTTP_CONNECT_TIMEOUT', '5'))
+STRIPE_HTTP_READ_TIMEOUT = float(os.getenv('STRIPE_HTTP_READ_TIMEOUT', '30'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', '2'))
+# Сколько секунд заказ переиспользует созданные Checkout Session и
+# Payment Intent. Меньше суток: столько Stripe хранит ключи
+# идемпотентности и живет Checkout Session.
+STRIPE_OBJECT_REUSE_SECONDS = int(
+    os.getenv('STRIPE_OBJECT_REUSE_SECONDS', str(23 * 60 * 60)))
+# Ограничение частоты запросов к Stripe на аккаунт (api/throttling.py):
+# запросов в секунду (0 — без ограничения), сколько можно подряд и
+# сколько секунд запрос может ждать токен, прежде чем получить 503.
+# Лимит общий для воркеров, если общий кэш (Redis).
+STRIPE_RATE_LIMIT = float(os.getenv('STRIPE_RATE_LIMIT', '25'))
+STRIPE_RATE_LIMIT_BURST = float(os.getenv('STRIPE_RATE_LIMIT_BURST', '0'))
+STRIPE_RATE_LIMIT_MAX_WAIT = float(
+    os.getenv('STRIPE_RATE_LIMIT_MAX_WAIT', '5'))
+# Одинаковые одновременные запросы оплаты одного заказа делят один
+# вызов Stripe.
+STRIPE_COALESCE_REQUESTS = (
+    os.getenv('STRIPE_COALESCE_REQUESTS', 'True') == 'True')
+# Фоновые задачи Stripe (api/jobs.py). off — запросы к Stripe внутри
+# HTTP-запроса, prefer — фоновой задачей для запросов с заголовком
+# Prefer: respond-async, always — всегда фоновой задачей.
+STRIPE_JOBS_MODE = os.getenv('STRIPE_JOBS_MODE', 'off')
+# Выполнять задачи пулом потоков в процессе приложения; иначе нужна
+# команда process_stripe_jobs.
+STRIPE_JOBS_IN_PROCESS = os.getenv('STRIPE_JOBS_IN_PROCESS', 'False') == 'True'
+STRIPE_JOBS_CONCURRENCY = int(os.getenv('STRIPE_JOBS_CONCURRENCY', '8'))
+STRIPE_JOBS_POLL_INTERVAL = float(
+    os.getenv('STRIPE_JOBS_POLL_INTERVAL', '1'))
+STRIPE_JOBS_MAX_ATTEMPTS = int(os.getenv('STRIPE_JOBS_MAX_ATTEMPTS', '5'))
+STRIPE_JOBS_RETRY_BASE_DELAY = float(
+    os.getenv('STRIPE_JOBS_RETRY_BASE_DELAY', '1'))
+STRIPE_JOBS_RETRY_MAX_DELAY = float(
+    os.getenv('STRIPE_JOBS_RETRY_MAX_DELAY', '60'))
+STRIPE_JOBS_LEASE_SECONDS = int(os.getenv('STRIPE_JOBS_LEASE_SECONDS', '120'))
+# Retry-After (секунды) в ответах о незавершенной задаче: через сколько
+# клиенту снова запросить GET /api/jobs/<id>/.
+STRIPE_JOBS_RETRY_AFTER = int(os.getenv('STRIPE_JOBS_RETRY_AFTER', '1'))